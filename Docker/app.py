@@ -1,11 +1,21 @@
-import os, base64, re, requests, json
-from flask import Flask, render_template, request, jsonify, send_file
+import os, base64, json, time, hashlib, threading
+from urllib.parse import urlsplit, parse_qsl
+from flask import Flask, render_template, request, jsonify, send_file, Response, stream_with_context, g
 from io import BytesIO
-from PIL import ImageFont
-import plex_utils, logic
+import plex_utils, logic, pipeline, jobs, image_cache, artist_index, status_store, render_cache, fonts, uploads, metrics, previews
+from concurrent.futures import TimeoutError as FutureTimeout
 
 app = Flask(__name__)
 
+# Uploaded logos arrive as data URLs in the JSON body
+app.config['MAX_CONTENT_LENGTH'] = int(os.environ.get('MAX_UPLOAD_BYTES', 32 * 1024 * 1024))
+
+# How long a save waits for its Plex upload before answering "queued"
+UPLOAD_WAIT = float(os.environ.get('PLEX_UPLOAD_WAIT', 15))
+
+# Remote logos are effectively immutable, so let browsers keep them for a day
+PROXY_MAX_AGE = int(os.environ.get('PROXY_MAX_AGE', 86400))
+
 def load_default_fonts():
     """Loads default fonts from fonts.txt, with a fallback list."""
     try:
@@ -20,85 +30,65 @@ def load_default_fonts():
         ]
 
 DEFAULT_FONTS = load_default_fonts()
+# How long a preview waits for a font that is still downloading
+FONT_PREVIEW_WAIT = float(os.environ.get('FONT_PREVIEW_WAIT', 3))
+# Text logo previews are sent as a small JPEG rendition
+PREVIEW_SIZE = int(os.environ.get('PREVIEW_SIZE', 500))
+PREVIEW_QUALITY = int(os.environ.get('PREVIEW_QUALITY', 85))
+
+@app.before_request
+def start_timer():
+    g.started = time.perf_counter()
+    g.profile = metrics.start_request()
+
+@app.after_request
+def remember_status(response):
+    g.status = response.status_code
+    return response
+
+@app.teardown_request
+def record_request(exc):
+    if 'started' not in g:
+        return
+    endpoint = request.endpoint or 'unmatched'
+    if exc is not None:
+        # Flask prints the traceback itself
+        metrics.inc('errors_total', where=endpoint)
+        metrics.log('error', level='error', where=endpoint, message=repr(exc), path=request.path)
+    metrics.finish_request(endpoint, request.method, g.get('status', 500), time.perf_counter() - g.started, g.profile)
 
 @app.route('/')
 def index():
-    lib = plex_utils.get_library(os.environ.get('LIBRARY_NAME', 'Music'))
-    artists = sorted(lib.all(), key=lambda x: re.sub(r'^(the|a|an)\s+', '', x.title.lower()))
-    
-    data = []
-    for a in artists:
-        path = plex_utils.get_artist_path(a.title)
-        status_file = os.path.join(path, '.status')
-        status = 'none'
-        if os.path.exists(status_file):
-            with open(status_file, 'r') as f:
-                status = f.read().strip()
-        data.append({'obj': a, 'status': status})
-    return render_template('index.html', artists=data, fonts=DEFAULT_FONTS)
-
-def download_font_if_needed(font_name):
-    """Checks if a font is available locally, and if not, downloads it from Google Fonts."""
-    # Let's not assume ttf. We'll check for any valid font file.
-    font_basename = f"{font_name.replace(' ', '')}-Regular"
-    font_dir = logic.FONT_DIR
-    
-    # Check if a font file exists (with any supported extension)
-    for ext in ['.ttf', '.otf', '.woff', '.woff2']:
-        f_path = os.path.join(font_dir, font_basename + ext)
-        if os.path.exists(f_path):
-            return f_path
-
-    print(f"Font '{font_name}' not found locally. Attempting to download from Google Fonts...")
+    # The sidebar is filled from /api/artists, so the page itself stays small
+    return render_template('index.html', fonts=DEFAULT_FONTS)
+
+@app.route('/api/artists')
+def list_artists():
+    """Paginated artist list.
+
+    Query args: q (search), status (all/none/custom/done), cursor, limit and
+    keys_only=1 to get every matching ratingKey (used by "Select All").
+    """
+    statuses = status_store.load_all()
+    matches = artist_index.search(statuses, request.args.get('q', ''), request.args.get('status', 'all'),
+                                  fuzzy=request.args.get('fuzzy', '1') != '0')
+    if request.args.get('keys_only') == '1':
+        return jsonify({'keys': [a['key'] for a in matches], 'total': len(matches)})
 
     try:
-        css_url = f"https://fonts.googleapis.com/css2?family={font_name.replace(' ', '+')}:wght@400&display=swap"
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110 Safari/537.36'
-        }
-        css_response = requests.get(css_url, headers=headers)
-        css_response.raise_for_status()
-        css_text = css_response.text
-
-        # Find all font URLs
-        font_urls = re.findall(r"url\((http.*?)\)", css_text)
-        if not font_urls:
-            print(f"Could not find any font URL in the CSS for '{font_name}'.")
-            return None
-
-        # Prefer ttf, but take what we can get. Let's try to find a URL for the 'latin' subset if possible.
-        # This is tricky because there are multiple font-face declarations.
-        # For simplicity, let's just take the last URL, which is often the one for the basic latin set.
-        font_url = font_urls[-1]
-
-        # Determine file extension
-        extension = ".ttf" # default
-        if ".woff2" in font_url:
-            extension = ".woff2"
-        elif ".woff" in font_url:
-            extension = ".woff"
-        elif ".otf" in font_url:
-            extension = ".otf"
-
-        font_filename = font_basename + extension
-        f_path = os.path.join(font_dir, font_filename)
-
-        font_response = requests.get(font_url)
-        font_response.raise_for_status()
-
-        os.makedirs(font_dir, exist_ok=True)
-        with open(f_path, 'wb') as f:
-            f.write(font_response.content)
-
-        print(f"Successfully downloaded and saved '{font_name}' to '{f_path}'.")
-        return f_path
-
-    except requests.exceptions.RequestException as e:
-        print(f"Error downloading font '{font_name}': {e}")
-        return None
-    except Exception as e:
-        print(f"An unexpected error occurred while downloading font '{font_name}': {e}")
-        return None
+        cursor = max(0, int(request.args.get('cursor') or 0))
+        limit = min(500, max(1, int(request.args.get('limit', 100))))
+    except ValueError:
+        return jsonify({'status': 'error', 'message': 'invalid cursor or limit'}), 400
+    page = matches[cursor:cursor + limit]
+    next_cursor = str(cursor + limit) if cursor + limit < len(matches) else None
+    return jsonify({
+        'artists': [{'key': a['key'], 'title': a['title'], 'status': statuses.get(a['key'], 'none')} for a in page],
+        'next_cursor': next_cursor,
+        'total': len(matches),
+        # The sidebar asks again while the artist list can't be loaded yet
+        'loading': not artist_index.ready(),
+    })
 
 @app.route('/get_options/<rating_key>')
 def get_options(rating_key):
@@ -127,26 +117,29 @@ def set_poster():
         return jsonify({'status': 'error', 'message': 'artist not found'}), 404
 
     try:
-        resp = requests.get(url, timeout=20)
-        resp.raise_for_status()
-        # Save to a temporary file so plexapi can upload it
-        import tempfile
-        tf = tempfile.NamedTemporaryFile(delete=False, suffix='.jpg')
-        tf.write(resp.content)
-        tf.flush()
-        tf.close()
+        cached = image_cache.fetch(url, timeout=20)
+    except Exception as e:
+        metrics.error('set_poster', f"set_poster error: {e}", rating_key=rating_key, url=url)
+        return jsonify({'status': 'error', 'message': str(e)}), 500
+    return upload_response(uploads.submit(artist, cached.read()))
 
-        artist.uploadPoster(filepath=tf.name)
 
-        try:
-            os.remove(tf.name)
-        except Exception:
-            pass
+def send_cached_image(cached, max_age):
+    """Send a cached image with its content hash as ETag so browsers can revalidate.
 
-        return jsonify({'status': 'success'})
-    except Exception as e:
-        print(f"set_poster error: {e}")
-        return jsonify({'status': 'error', 'message': str(e)}), 500
+    Images not cached yet are streamed through as they download; they get an
+    ETag from the next request on.
+    """
+    if isinstance(cached, image_cache.StreamedImage):
+        resp = Response(stream_with_context(iter(cached)), mimetype=cached.content_type)
+        resp.call_on_close(cached.close)
+        if cached.content_length:
+            resp.headers['Content-Length'] = cached.content_length
+        resp.cache_control.max_age = max_age
+    else:
+        resp = send_file(cached.path, mimetype=cached.content_type, etag=cached.digest, max_age=max_age, conditional=True)
+    resp.cache_control.public = True
+    return resp
 
 
 @app.route('/proxy_image')
@@ -159,7 +152,7 @@ def proxy_image():
     try:
         normalized = plex_utils.resource_to_url(url)
     except Exception as e:
-        print(f"proxy_image resource_to_url error for {url}: {e}")
+        metrics.error('proxy_image', f"proxy_image resource_to_url error for {url}: {e}", url=url)
         return jsonify({'status': 'error', 'message': 'invalid url'}), 400
 
     if not normalized or not (normalized.startswith('http://') or normalized.startswith('https://')):
@@ -168,166 +161,251 @@ def proxy_image():
     url = normalized
 
     try:
-        r = requests.get(url, timeout=15)
-        r.raise_for_status()
-        ct = r.headers.get('Content-Type', 'image/jpeg') or r.headers.get('Content-Type') or 'application/octet-stream'
-        return send_file(BytesIO(r.content), mimetype=ct)
+        cached = image_cache.open_url(url, timeout=15)
+        return send_cached_image(cached, max_age=PROXY_MAX_AGE)
     except Exception as e:
-        print(f"proxy_image error fetching {url}: {e}")
+        metrics.error('proxy_image', f"proxy_image error fetching {url}: {e}", url=url)
         return jsonify({'status': 'error', 'message': str(e)}), 502
 
+TRANSFORM_PARAMS = previews.TRANSFORM_PARAMS
+
+def text_logo(artist, args, font_wait):
+    """Return (digest, canvas) for an artist's text logo.
+
+    `canvas` is the full-size render as PNG; it is cached under a digest of
+    everything that affects it, so previews and saves share one render.
+    """
+    f_path = fonts.ensure(args.get('font', 'Roboto'), timeout=font_wait)
+    spec = previews.text_spec(args)
+    digest = previews.text_digest(artist.title, f_path, spec)
+    key = previews.canvas_key(digest)
+    canvas = render_cache.get(key)
+    if canvas is None:
+        canvas = logic.encode(logic.generate_text_logo(artist.title, f_path, **spec), 'png')
+        render_cache.put(key, canvas)
+    return digest, canvas
+
+def publish(artist, rating_key, outputs, status, origin, **manifest):
+    """Write the renditions to the artist folder, mark the artist and upload to Plex."""
+    result = pipeline.publish(artist, rating_key, outputs, status, origin, **manifest)
+    # Saving the same logo again leaves the files and the Plex poster alone
+    if result is None:
+        return jsonify({"status": "success", "unchanged": True})
+    if result is True:
+        return jsonify({"status": "success"})
+    return upload_response(result)
+
+def upload_response(upload):
+    """Wait briefly for a queued upload; if it is still retrying, report it as queued."""
+    try:
+        upload.result(timeout=UPLOAD_WAIT)
+    except FutureTimeout:
+        return jsonify({"status": "success", "upload": "queued"})
+    except Exception as e:
+        return jsonify({'status': 'error', 'message': f'upload to Plex failed: {e}'}), 502
+    return jsonify({"status": "success"})
+
 @app.route('/save', methods=['POST'])
 def save():
     data = request.json
     artist = plex_utils.fetch_artist(data['rating_key'])
     if data['url'].startswith('data:image'):
-        img = logic.Image.open(BytesIO(base64.b64decode(data['url'].split(',')[1])))
+        source = base64.b64decode(data['url'].split(',')[1])
+        digest = hashlib.sha256(source).hexdigest()
+    elif data['url'].startswith('/preview_text/'):
+        # A text logo preview, possibly with filters applied on top
+        digest, source = text_logo(artist, dict(parse_qsl(urlsplit(data['url']).query)), font_wait=30)
     else:
-        img = logic.Image.open(BytesIO(requests.get(data['url']).content))
-    
-    final = logic.apply_transforms(img, **{k: data.get(k) for k in ['apply_default_size', 'invert', 'make_white', 'contrast', 'zoom', 'monochrome', 'tint']})
-    path = plex_utils.get_artist_path(artist.title)
-    os.makedirs(path, exist_ok=True)
-    final.save(os.path.join(path, "artist.jpg"), "JPEG", quality=95)
-    
-    with open(os.path.join(path, '.status'), 'w') as f:
-        f.write('done')
-
-    if os.environ.get('UPDATE_PLEX', 'false').lower() == 'true': artist.uploadPoster(filepath=os.path.join(path, "artist.jpg"))
-    return jsonify({"status": "success"})
+        cached = image_cache.fetch(data['url'])
+        source, digest = cached.read(), cached.digest
+    params = {k: data.get(k) for k in TRANSFORM_PARAMS}
+    try:
+        outputs = render_cache.render(source, digest, **params)
+    except (logic.SourceTooLarge, logic.Image.DecompressionBombError) as e:
+        return jsonify({'status': 'error', 'message': f'image too large: {e}'}), 413
+    source_url = None if data['url'].startswith('data:') else data['url']
+    return publish(artist, data['rating_key'], outputs, 'done', 'manual', source_url=source_url, source_digest=digest, params=params)
 
 @app.route('/save_custom', methods=['POST'])
 def save_custom():
     data = request.json
     artist = plex_utils.fetch_artist(data['rating_key'])
-    font_name = data.get('font', 'Roboto') # Default to Roboto
-
-    f_path = download_font_if_needed(font_name)
-    if not f_path:
-        f_path = ImageFont.load_default()
-
-    img = logic.generate_text_logo(artist.title, f_path, **{k: data.get(k) for k in ['rows', 'color', 'case']})
-    path = plex_utils.get_artist_path(artist.title)
-    os.makedirs(path, exist_ok=True)
-    img.save(os.path.join(path, "artist.jpg"), "JPEG", quality=95)
-    
-    with open(os.path.join(path, '.status'), 'w') as f:
-        f.write('custom')
-
-    if os.environ.get('UPDATE_PLEX', 'false').lower() == 'true': artist.uploadPoster(filepath=os.path.join(path, "artist.jpg"))
-    return jsonify({"status": "success"})
+    # Wait for a font that is still downloading rather than saving with the fallback
+    try:
+        digest, canvas = text_logo(artist, data, font_wait=30)
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    outputs = logic.renditions(logic.Image.open(BytesIO(canvas)))
+    return publish(artist, data['rating_key'], outputs, 'custom', 'custom', source_digest=digest)
 
 @app.route('/toggle_status/<rating_key>', methods=['POST'])
 def toggle_status(rating_key):
-    artist = plex_utils.fetch_artist(rating_key)
-    path = plex_utils.get_artist_path(artist.title)
-    os.makedirs(path, exist_ok=True)
-    status_file = os.path.join(path, '.status')
-    
-    current_status = 'none'
-    if os.path.exists(status_file):
-        with open(status_file, 'r') as f:
-            current_status = f.read().strip()
-            
-    if current_status == 'none':
-        next_status = 'custom'
-    elif current_status == 'custom':
-        next_status = 'done'
-    else: # done
-        next_status = 'none'
-        
-    with open(status_file, 'w') as f:
-        f.write(next_status)
-        
+    next_status = status_store.next_status(status_store.get(rating_key))
+    status_store.set_status(rating_key, next_status)
     return jsonify({'status': 'success', 'new_status': next_status})
 
+def run_bulk_toggle_status(artist_keys, should_stop):
+    # Toggles are cheap, so the whole selection is applied in one transaction
+    if should_stop():
+        return
+    for key, next_status in status_store.toggle_many(artist_keys).items():
+        yield {'key': key, 'result': 'updated', 'new_status': next_status}
+
+jobs.register('apply_fanart', pipeline.run_bulk_apply)
+jobs.register('sync', pipeline.run_sync)
+jobs.register('toggle_status', run_bulk_toggle_status)
+
 @app.route('/bulk_apply_fanart', methods=['POST'])
 def bulk_apply_fanart():
     data = request.json
-    artist_keys = data.get('artist_keys', [])
-    updated_count = 0
-
-    for key in artist_keys:
-        try:
-            artist = plex_utils.fetch_artist(key)
-            logos = plex_utils.get_fanart_logos(artist)
-            
-            if logos:
-                most_popular_logo_url = logos[0]
-                
-                img = logic.Image.open(BytesIO(requests.get(most_popular_logo_url).content))
-                final = logic.apply_transforms(img, apply_default_size=True) # Using default sizing
-                
-                path = plex_utils.get_artist_path(artist.title)
-                os.makedirs(path, exist_ok=True)
-                final.save(os.path.join(path, "artist.jpg"), "JPEG", quality=95)
-                
-                if os.path.exists(os.path.join(path, ".custom")):
-                    os.remove(os.path.join(path, ".custom"))
-                
-                if os.environ.get('UPDATE_PLEX', 'false').lower() == 'true':
-                    artist.uploadPoster(filepath=os.path.join(path, "artist.jpg"))
-                
-                updated_count += 1
-        except Exception as e:
-            print(f"Error updating artist {key}: {e}")
-            continue
-            
-    return jsonify({"status": "success", "updated_count": updated_count})
+    job_id = jobs.submit('apply_fanart', data.get('artist_keys', []))
+    return jsonify({"status": "success", "job_id": job_id})
 
 @app.route('/bulk_toggle_status', methods=['POST'])
 def bulk_toggle_status():
-    data = request.json
-    artist_keys = data.get('artist_keys', [])
-    updated_artists = []
-    
-    for key in artist_keys:
-        try:
-            artist = plex_utils.fetch_artist(key)
-            path = plex_utils.get_artist_path(artist.title)
-            os.makedirs(path, exist_ok=True)
-            status_file = os.path.join(path, '.status')
-            
-            current_status = 'none'
-            if os.path.exists(status_file):
-                with open(status_file, 'r') as f:
-                    current_status = f.read().strip()
-            
-            if current_status == 'none':
-                next_status = 'custom'
-            elif current_status == 'custom':
-                next_status = 'done'
-            else: # done
-                next_status = 'none'
-                
-            with open(status_file, 'w') as f:
-                f.write(next_status)
-            
-            updated_artists.append({'key': key, 'new_status': next_status})
-        except Exception as e:
-            print(f"Error updating artist {key}: {e}")
-            continue
-            
-    return jsonify({"status": "success", "updated_count": len(updated_artists), "updated_artists": updated_artists})
-
-
-@app.route('/preview_text', methods=['POST'])
-def preview_text():
-    data = request.json
-    artist = plex_utils.fetch_artist(data['rating_key'])
-    font_name = data.get('font', 'Roboto') # Default to Roboto
-
-    f_path = download_font_if_needed(font_name)
-    if not f_path:
-        f_path = ImageFont.load_default()
+    # One transaction, so it runs inline rather than queueing behind a long job
+    data = request.json or {}
+    new_statuses = status_store.toggle_many(data.get('artist_keys', []))
+    return jsonify({"status": "success", "new_statuses": new_statuses, "updated_count": len(new_statuses)})
+
+@app.route('/sync', methods=['POST'])
+def sync():
+    """Queue a sync job over the whole library: new artists and changed logos only."""
+    # Pick up artists added since the last index refresh
+    artist_index.refresh()
+    job_id = jobs.submit('sync', [a['key'] for a in artist_index.artists()])
+    return jsonify({"status": "success", "job_id": job_id})
+
+@app.route('/jobs', methods=['GET', 'POST'])
+def jobs_index():
+    if request.method == 'GET':
+        return jsonify({"jobs": jobs.list_jobs()})
+    data = request.json or {}
+    try:
+        job_id = jobs.submit(data.get('kind'), data.get('artist_keys', []))
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    return jsonify({"status": "success", "job_id": job_id})
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    job = jobs.get(job_id)
+    if not job:
+        return jsonify({'status': 'error', 'message': 'job not found'}), 404
+    try:
+        since = int(request.args.get('since', 0))
+    except ValueError:
+        return jsonify({'status': 'error', 'message': 'invalid since'}), 400
+    job['results'] = [r for _, r in jobs.results_since(job_id, since)]
+    return jsonify(job)
+
+@app.route('/jobs/<job_id>/events')
+def job_events(job_id):
+    """Streams each finished artist as an NDJSON line, then the final job state."""
+    if not jobs.get(job_id):
+        return jsonify({'status': 'error', 'message': 'job not found'}), 404
+
+    def generate():
+        seq = 0
+        while True:
+            job = jobs.get(job_id)
+            for seq, result in jobs.results_since(job_id, seq):
+                yield json.dumps(result) + '\n'
+            if job['status'] not in ('queued', 'running'):
+                # Pick up anything recorded between the two reads above
+                for seq, result in jobs.results_since(job_id, seq):
+                    yield json.dumps(result) + '\n'
+                yield json.dumps(job) + '\n'
+                return
+            time.sleep(0.5)
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+@app.route('/jobs/<job_id>/cancel', methods=['POST'])
+def cancel_job(job_id):
+    if not jobs.cancel(job_id):
+        return jsonify({'status': 'error', 'message': 'job is not running'}), 409
+    return jsonify({'status': 'success'})
+
+@app.route('/jobs/<job_id>/resume', methods=['POST'])
+def resume_job(job_id):
+    if not jobs.resume(job_id):
+        return jsonify({'status': 'error', 'message': 'job cannot be resumed'}), 409
+    return jsonify({'status': 'success'})
+
+
+@app.route('/uploads')
+def uploads_status():
+    return jsonify(uploads.stats())
+
+@app.route('/fonts')
+def fonts_status():
+    return jsonify(fonts.status())
+
+@app.route('/preview_text/<rating_key>')
+def preview_text(rating_key):
+    """Small rendition of a text logo, sent as an image.
+
+    The ETag is the render's cache key, so the browser revalidates cheaply;
+    it changes once a font that was still downloading becomes available.
+    """
+    artist = plex_utils.fetch_artist(rating_key)
+    # Previews fall back to the default font while the real one downloads
+    try:
+        digest, canvas = text_logo(artist, request.args, font_wait=FONT_PREVIEW_WAIT)
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    key = render_cache.key(digest, {}, ('preview', PREVIEW_SIZE, 'jpeg', PREVIEW_QUALITY))
+    data = render_cache.get(key)
+    if data is None:
+        data = logic.renditions(logic.Image.open(BytesIO(canvas)), [PREVIEW_SIZE], 'jpeg', PREVIEW_QUALITY)[PREVIEW_SIZE]
+        render_cache.put(key, data)
+    return send_file(BytesIO(data), mimetype='image/jpeg', etag=key, max_age=0, conditional=True)
+
+def sprite_response(artist, candidates, options):
+    """Render candidates into one sprite; the cell layout is sent in the X-Sprite-Layout header."""
+    if not artist:
+        return jsonify({'status': 'error', 'message': 'artist not found'}), 404
+    if not isinstance(candidates, list) or not all(isinstance(c, dict) for c in candidates) \
+            or not 0 < len(candidates) <= previews.MAX_CANDIDATES:
+        return jsonify({'status': 'error', 'message': f'between 1 and {previews.MAX_CANDIDATES} candidates required'}), 400
+    try:
+        size = min(previews.MAX_THUMB_SIZE, max(32, int(options.get('size') or previews.THUMB_SIZE)))
+        columns = min(20, max(1, int(options.get('columns') or 6)))
+    except ValueError:
+        return jsonify({'status': 'error', 'message': 'invalid size or columns'}), 400
+    transform = options.get('transform') or {}
+    if not isinstance(transform, dict):
+        return jsonify({'status': 'error', 'message': 'transform must be an object'}), 400
+    transform = {k: v for k, v in transform.items() if k in TRANSFORM_PARAMS}
+    try:
+        render_cache.normalize(**transform)
+        for c in candidates:
+            previews.text_spec(c)
+    except (TypeError, ValueError) as e:
+        return jsonify({'status': 'error', 'message': f'invalid transform or text settings: {e}'}), 400
+    data, layout, key = previews.render_sheet(artist.title, candidates, size, columns,
+                                              transform, font_wait=FONT_PREVIEW_WAIT)
+    resp = send_file(BytesIO(data), mimetype='image/jpeg', etag=key, max_age=0, conditional=True)
+    resp.headers['X-Sprite-Layout'] = json.dumps(layout)
+    return resp
+
+@app.route('/previews/<rating_key>', methods=['POST'])
+def batch_previews(rating_key):
+    """Thumbnails of many candidates in one sprite.
+
+    Body: {candidates: [{url, <transform params>} or {font, rows, color, case}],
+    transform: {...} applied to every url candidate, size, columns}.
+    """
+    data = request.json or {}
+    return sprite_response(plex_utils.fetch_artist(rating_key), data.get('candidates'), data)
 
-    img = logic.generate_text_logo(artist.title, f_path, **{k: data.get(k) for k in ['rows', 'color', 'case']})
-    
-    buffered = BytesIO()
-    img.save(buffered, format="JPEG")
-    img_str = base64.b64encode(buffered.getvalue()).decode('utf-8')
-    
-    return jsonify({"image": img_str})
+@app.route('/contact_sheet/<rating_key>')
+def contact_sheet(rating_key):
+    """The artist's name in every font (or each `font` arg) as one sprite; args as for /preview_text."""
+    spec = {k: request.args[k] for k in previews.TEXT_PARAMS if k in request.args}
+    candidates = [dict(spec, font=f) for f in request.args.getlist('font') or DEFAULT_FONTS]
+    return sprite_response(plex_utils.fetch_artist(rating_key), candidates, request.args)
 
 @app.route('/plex_proxy/<rating_key>')
 def plex_proxy(rating_key):
@@ -339,17 +417,60 @@ def plex_proxy(rating_key):
         if not thumb_url:
             return 'thumb not available', 404
 
-        r = requests.get(thumb_url, timeout=15)
-        r.raise_for_status()
-        return send_file(BytesIO(r.content), mimetype=r.headers.get('Content-Type', 'image/jpeg'))
+        cached = image_cache.open_url(thumb_url, timeout=15)
+        # The thumb changes whenever we upload, so make browsers revalidate
+        return send_cached_image(cached, max_age=0)
     except Exception as e:
-        print(f"plex_proxy error: {e}")
+        metrics.error('plex_proxy', f"plex_proxy error: {e}", rating_key=rating_key)
         return 'error', 500
 
+@app.route('/metrics')
+def metrics_endpoint():
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/ready')
+def ready():
+    """Readiness: 200 once Plex is connected and the artist index is loaded, 503 while warming up."""
+    state = dict(_warmup, plex=plex_utils.server_state(), fonts_downloading=fonts.status()['downloading'])
+    ok = state['plex'] == 'connected' and state['artists'] == 'ready'
+    return jsonify({'ready': ok, **state}), 200 if ok else 503
+
+# Startup work runs in the background so the server answers straight away,
+# even when Plex or Google Fonts is slow or unreachable.
+_warmup = {'fonts': 'pending', 'artists': 'pending'}
+
+def warm_up():
+    # Missing fonts are downloaded by the font module's own workers
+    fonts.start(DEFAULT_FONTS)
+    _warmup['fonts'] = 'ready'
+    while True:
+        try:
+            if plex_utils.get_library(artist_index.LIBRARY_NAME):
+                break
+        except Exception as e:
+            print(f"Library '{artist_index.LIBRARY_NAME}' not available yet: {e}")
+        time.sleep(plex_utils.PLEX_RETRY_INTERVAL)
+    _warmup['artists'] = 'loading'
+    # The legacy import is one-time, so it must not run against an index
+    # that failed to load
+    while True:
+        artists = artist_index.artists()
+        if artist_index.ready():
+            break
+        print("Artist index not loaded yet, retrying")
+        time.sleep(plex_utils.PLEX_RETRY_INTERVAL)
+    status_store.import_legacy(artists)
+    _warmup['artists'] = 'ready'
+
+def start_background():
+    """Start the work that runs alongside the web server."""
+    # Resume any bulk jobs interrupted by a restart
+    jobs.start()
+    if int(os.environ.get('WEB_WORKERS', 1)) > 1:
+        metrics.share()
+    threading.Thread(target=warm_up, daemon=True, name='warm-up').start()
+
 if __name__ == '__main__':
-    # Download all fonts on startup
-    print("Downloading all fonts listed in fonts.txt...")
-    for font in DEFAULT_FONTS:
-        download_font_if_needed(font)
-    print("Font download process finished.")
-    app.run(host='0.0.0.0', port=5000)
\ No newline at end of file
+    # Development server; the container runs wsgi.py under gunicorn
+    start_background()
+    app.run(host='0.0.0.0', port=5000, threaded=True)
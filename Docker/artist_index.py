@@ -0,0 +1,148 @@
+import os, re, json, time, threading
+from kvcache import CACHE_DIR
+import plex_utils
+
+try:
+    from rapidfuzz import process, fuzz
+except ImportError:
+    process = None
+
+# Lightweight in-memory listing of the music library (ratingKey, title, sort
+# key). It is persisted between restarts and kept current with incremental
+# "updated since" queries; a full reload only happens when the artist count
+# no longer matches Plex (i.e. artists were removed).
+INDEX_FILE = os.path.join(CACHE_DIR, 'artist_index.json')
+REFRESH_INTERVAL = int(os.environ.get('ARTIST_INDEX_REFRESH', 60))
+FUZZY_CUTOFF = int(os.environ.get('ARTIST_SEARCH_FUZZY_CUTOFF', 75))
+LIBRARY_NAME = os.environ.get('LIBRARY_NAME', 'Music')
+
+_artists = {}
+_sorted = []
+_updated_at = 0
+_refreshed_at = 0
+_loaded = False
+_lock = threading.Lock()
+_refreshing = threading.Lock()
+
+
+def sort_key(title):
+    return re.sub(r'^(the|a|an)\s+', '', title.lower())
+
+
+def _publish():
+    global _sorted
+    _sorted = sorted(_artists.values(), key=lambda a: a['sort'])
+
+
+def _load_snapshot():
+    global _updated_at, _loaded
+    _loaded = True
+    try:
+        with open(INDEX_FILE, 'r') as f:
+            snap = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return
+    if snap.get('library') != LIBRARY_NAME:
+        return
+    _artists.update({a['key']: a for a in snap.get('artists', [])})
+    _updated_at = snap.get('updated_at', 0)
+    _publish()
+
+
+def _save_snapshot():
+    os.makedirs(os.path.dirname(INDEX_FILE), exist_ok=True)
+    # Each worker process keeps its own index; the snapshot is replaced whole
+    tmp = f'{INDEX_FILE}.{os.getpid()}.tmp'
+    with open(tmp, 'w') as f:
+        json.dump({'library': LIBRARY_NAME, 'updated_at': _updated_at, 'artists': list(_artists.values())}, f)
+    os.replace(tmp, INDEX_FILE)
+
+
+def refresh(full=False, wait=False):
+    """Pull changes from Plex into the index. Only one refresh runs at a time.
+
+    A refresh already running is skipped, or with `wait` waited for; if that
+    one filled the index, there is nothing left to do.
+    """
+    global _updated_at, _refreshed_at
+    if not _refreshing.acquire(blocking=wait):
+        return
+    try:
+        if wait and _sorted:
+            return
+        lib = plex_utils.get_library(LIBRARY_NAME)
+        if not lib:
+            return
+        incremental = bool(_artists) and not full
+        rows = plex_utils.list_artists(lib, _updated_at if incremental else None)
+        # Incremental queries can't see removals, so reload when counts drift
+        if incremental and len(set(_artists) | {r['key'] for r in rows}) != plex_utils.count_artists(lib):
+            incremental = False
+            rows = plex_utils.list_artists(lib)
+        with _lock:
+            if not incremental:
+                _artists.clear()
+            for r in rows:
+                _artists[r['key']] = {'key': r['key'], 'title': r['title'], 'sort': sort_key(r['title'])}
+                _updated_at = max(_updated_at, r['updated_at'])
+            _publish()
+        _refreshed_at = time.time()
+        if rows or not incremental:
+            _save_snapshot()
+    except Exception as e:
+        print(f"Artist index refresh error: {e}")
+    finally:
+        _refreshing.release()
+
+
+def artists():
+    """Return all artists sorted for display.
+
+    Serves the current snapshot immediately and refreshes in the background
+    when it is older than REFRESH_INTERVAL. Only the very first load blocks,
+    including callers arriving while it runs (e.g. during warm-up).
+    """
+    with _lock:
+        if not _loaded:
+            _load_snapshot()
+    if not _sorted:
+        refresh(full=True, wait=True)
+    elif time.time() - _refreshed_at > REFRESH_INTERVAL:
+        threading.Thread(target=refresh, daemon=True, name='artist-index-refresh').start()
+    return _sorted
+
+
+def ready():
+    """False until the index has been filled from a snapshot or from Plex (e.g. while Plex is unreachable)."""
+    return bool(_sorted) or _refreshed_at > 0
+
+
+def search(statuses, q='', status='all', fuzzy=True):
+    """Filter the index by title and status.
+
+    Substring matches come first in display order (prefix matches ahead of the
+    rest); with `fuzzy`, close misspellings follow ranked by score.
+    """
+    rows = artists()
+    if status and status != 'all':
+        rows = [a for a in rows if statuses.get(a['key'], 'none') == status]
+    q = (q or '').strip().lower()
+    if not q:
+        return rows
+
+    prefix, contains = [], []
+    for a in rows:
+        t = a['title'].lower()
+        if t.startswith(q) or a['sort'].startswith(q):
+            prefix.append(a)
+        elif q in t:
+            contains.append(a)
+    matches = prefix + contains
+
+    if fuzzy and process and len(q) >= 3:
+        seen = {a['key'] for a in matches}
+        rest = [a for a in rows if a['key'] not in seen]
+        scored = process.extract(q, [a['title'].lower() for a in rest], scorer=fuzz.WRatio,
+                                 score_cutoff=FUZZY_CUTOFF, limit=50)
+        matches += [rest[i] for _, _, i in scored]
+    return matches
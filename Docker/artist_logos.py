@@ -0,0 +1,189 @@
+"""Headless batch runner for cron and scripts, sharing the web app's pipeline.
+
+    python -m artist_logos batch --sync
+    python -m artist_logos batch --status none --dry-run
+    python -m artist_logos batch --keys-file keys.txt --workers 4
+    python -m artist_logos batch --resume
+    python -m artist_logos jobs
+
+Runs are recorded in the same jobs database as the web UI, so they show up
+there and can be resumed from either side. Flask is never imported and Plex
+is only contacted once there is work to select.
+"""
+import os, sys, signal, argparse
+from collections import Counter
+
+BATCH_KINDS = ('apply_fanart', 'sync')
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(prog='python -m artist_logos', description='Artist logo batch runner')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    batch = sub.add_parser('batch', help='apply fanart.tv logos to many artists')
+    batch.add_argument('--library', default=os.environ.get('LIBRARY_NAME', 'Music'),
+                       help='Plex music library to select artists from (default: %(default)s)')
+    batch.add_argument('--status', choices=('all', 'none', 'custom', 'done'), default='all',
+                       help='only artists with this status (default: %(default)s)')
+    batch.add_argument('--keys-file', metavar='PATH',
+                       help="rating keys to process, one per line ('-' for stdin) instead of the whole library")
+    batch.add_argument('--limit', type=int, help='process at most this many artists')
+    batch.add_argument('--sync', action='store_true',
+                       help='skip hand-picked logos and artists whose chosen logo is already applied')
+    batch.add_argument('--dry-run', action='store_true',
+                       help='report what would be updated without writing or uploading (only logo previews are downloaded)')
+    batch.add_argument('--resume', nargs='?', const='last', metavar='JOB_ID',
+                       help='continue an interrupted run and retry its errors (default: the most recent such run)')
+    batch.add_argument('--workers', type=int, help='transform processes (BULK_TRANSFORM_WORKERS)')
+    batch.add_argument('--fetch-workers', type=int, help='concurrent downloads (BULK_FETCH_WORKERS)')
+    batch.add_argument('--no-upload', action='store_true', help='write files only, even if UPDATE_PLEX is set')
+    batch.add_argument('-q', '--quiet', action='store_true', help='only print the summary')
+
+    jobs_cmd = sub.add_parser('jobs', help='list recent jobs')
+    jobs_cmd.add_argument('--limit', type=int, default=20)
+    return parser.parse_args(argv)
+
+
+def configure(args):
+    """Apply command line overrides before the pipeline modules read their settings."""
+    if getattr(args, 'workers', None):
+        os.environ['BULK_TRANSFORM_WORKERS'] = str(args.workers)
+    if getattr(args, 'fetch_workers', None):
+        os.environ['BULK_FETCH_WORKERS'] = str(args.fetch_workers)
+    if getattr(args, 'no_upload', False):
+        os.environ['UPDATE_PLEX'] = 'false'
+
+
+def read_keys(path):
+    f = sys.stdin if path == '-' else open(path, 'r')
+    try:
+        return [line.split('#', 1)[0].strip() for line in f if line.split('#', 1)[0].strip()]
+    finally:
+        if f is not sys.stdin:
+            f.close()
+
+
+def select_artists(args):
+    """Return the rating keys to process, or None if the library can't be read."""
+    import plex_utils, status_store
+    if args.keys_file:
+        keys = read_keys(args.keys_file)
+    else:
+        lib = plex_utils.get_library(args.library)
+        if not lib:
+            print(f"Library '{args.library}' not found or Plex unavailable.", file=sys.stderr)
+            return None
+        keys = [a['key'] for a in sorted(plex_utils.list_artists(lib), key=lambda a: a['title'].lower())]
+    if args.status != 'all':
+        statuses = status_store.load_all()
+        keys = [k for k in keys if statuses.get(k, 'none') == args.status]
+    # Keep the first occurrence of duplicated keys
+    keys = list(dict.fromkeys(keys))
+    return keys[:args.limit] if args.limit else keys
+
+
+def last_unfinished(kinds):
+    """Most recent job of `kinds` that was interrupted (or killed) or has artists to retry."""
+    import jobs
+    return next((j['id'] for j in jobs.list_jobs(200)
+                 if j['kind'] in kinds and (j['status'] in ('cancelled', 'failed') or j['counts'].get('error')
+                                            or (j['status'] == 'running' and jobs.abandoned(j['id'])))), None)
+
+
+class Reporter:
+    def __init__(self, total, quiet=False):
+        self.total = total
+        self.quiet = quiet
+        self.done = 0
+        self.counts = Counter()
+
+    def __call__(self, result):
+        self.done += 1
+        outcome = result.get('result', 'error')
+        if outcome == 'updated' and result.get('unchanged'):
+            outcome = 'unchanged'
+        self.counts[outcome] += 1
+        if not self.quiet:
+            label = result.get('title') or result['key']
+            message = f" ({result['message']})" if result.get('message') else ''
+            print(f"[{self.done}/{self.total}] {label}: {outcome}{message}", flush=True)
+
+    def summary(self):
+        parts = ', '.join(f"{n} {outcome}" for outcome, n in sorted(self.counts.items()))
+        return f"{self.done} artists: {parts or 'nothing to do'}"
+
+
+def stop_on_interrupt(job_id):
+    """First Ctrl-C/SIGTERM cancels the job and lets in-flight artists finish; a second aborts."""
+    import jobs
+
+    def handler(signum, frame):
+        if jobs.cancel(job_id):
+            print(f"Stopping after in-flight artists; resume with --resume {job_id}", file=sys.stderr, flush=True)
+        else:
+            raise KeyboardInterrupt
+    signal.signal(signal.SIGINT, handler)
+    signal.signal(signal.SIGTERM, handler)
+
+
+def batch(args):
+    import jobs, pipeline
+    jobs.register('apply_fanart', pipeline.run_bulk_apply)
+    jobs.register('sync', pipeline.run_sync)
+
+    if args.resume:
+        job_id = last_unfinished(BATCH_KINDS) if args.resume == 'last' else args.resume
+        job = jobs.get(job_id) if job_id else None
+        if not job or job['kind'] not in BATCH_KINDS:
+            print('No interrupted batch job to resume.', file=sys.stderr)
+            return 2
+        if not jobs.resume(job_id, background=False):
+            print(f"Job {job_id} is {job['status']} and can't be resumed.", file=sys.stderr)
+            return 2
+        job = jobs.get(job_id)
+        total = job['counts'].get('pending', 0)
+        print(f"Resuming job {job_id} ({job['kind']}): {total} of {job['total']} artists left", flush=True)
+    else:
+        keys = select_artists(args)
+        if keys is None:
+            return 2
+        if args.dry_run:
+            reporter = Reporter(len(keys), args.quiet)
+            for result in pipeline.run_bulk_apply(keys, sync=args.sync, dry_run=True):
+                reporter(result)
+            print(f"Dry run, {reporter.summary()}")
+            return 1 if reporter.counts['error'] else 0
+        job_id = jobs.submit('sync' if args.sync else 'apply_fanart', keys, background=False)
+        total = len(keys)
+        print(f"Job {job_id}: {total} artists", flush=True)
+
+    reporter = Reporter(total, args.quiet)
+    stop_on_interrupt(job_id)
+    try:
+        status = jobs.run(job_id, on_result=reporter)
+    except KeyboardInterrupt:
+        jobs.cancel(job_id)
+        print(f"Aborted; resume with --resume {job_id}", file=sys.stderr)
+        return 130
+    print(f"Job {job_id} {status}, {reporter.summary()}")
+    if status == 'cancelled':
+        return 130
+    return 1 if status == 'failed' or reporter.counts['error'] else 0
+
+
+def list_jobs(args):
+    import jobs
+    for job in jobs.list_jobs(args.limit):
+        counts = ', '.join(f"{n} {state}" for state, n in sorted(job['counts'].items()))
+        print(f"{job['id']}  {job['kind']:<14} {job['status']:<10} {job['total']:>6} artists  {counts}")
+    return 0
+
+
+def main(argv=None):
+    args = parse_args(sys.argv[1:] if argv is None else argv)
+    configure(args)
+    return {'batch': batch, 'jobs': list_jobs}[args.command](args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
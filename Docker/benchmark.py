@@ -0,0 +1,375 @@
+"""Offline benchmarks for the image and text pipeline.
+
+    python benchmark.py --out results.json
+    python benchmark.py --quick --compare results.json
+
+Suites:
+- transforms: apply_transforms for every combination of options over a
+  synthetic corpus (small/medium/large, transparent/opaque, wide/square/tall).
+- text: generate_text_logo across fonts, row counts and artist name lengths.
+- save: /save and /save_custom equivalent processing (decode, transform,
+  encode the renditions, write the files), plus a render cache hit.
+- pipeline: a bulk job against local stand-ins for Plex and fanart.tv.
+
+Each case reports throughput, p50/p95 latency and the peak RSS so far. Nothing
+touches the network or the real data directories; fonts are Pillow's built-in
+font plus any found in --fonts-dir.
+"""
+import os, sys, io, json, time, random, shutil, argparse, platform, resource, tempfile, threading, itertools, multiprocessing
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Keep every store the app modules open inside a scratch directory. Transform
+# workers import this module again (as __mp_main__) and reuse the parent's.
+SCRATCH = os.environ.get('LOGO_BENCH_SCRATCH') or tempfile.mkdtemp(prefix='logo-bench-')
+os.environ.update(LOGO_BENCH_SCRATCH=SCRATCH, CACHE_DIR=os.path.join(SCRATCH, 'cache'), STATUS_DB=os.path.join(SCRATCH, 'status.db'),
+                  JOBS_DB=os.path.join(SCRATCH, 'jobs.db'), LOG_DIR=os.path.join(SCRATCH, 'logs'),
+                  FONTS_OFFLINE='true', UPDATE_PLEX='true')
+
+from PIL import Image, ImageDraw
+import logic, render_cache
+
+SIZES = {'small': 400, 'medium': 1500, 'large': 5000}
+ASPECTS = {'wide': (4, 1), 'square': (1, 1), 'tall': (1, 2)}
+NAMES = ['ABBA', 'The Rolling Stones', 'Godspeed You! Black Emperor and the Orchestra of Light']
+
+
+# Corpus
+
+def synthetic_logo(size, aspect, transparent, seed=0):
+    """Return (encoded bytes, format) for a deterministic logo-like image."""
+    rng = random.Random(f'{size}-{aspect}-{transparent}-{seed}')
+    long_side = SIZES[size]
+    aw, ah = ASPECTS[aspect]
+    w, h = (long_side, long_side * ah // aw) if aw >= ah else (long_side * aw // ah, long_side)
+    img = Image.new('RGBA' if transparent else 'RGB', (w, h), (0, 0, 0, 0) if transparent else (255, 255, 255))
+    draw = ImageDraw.Draw(img)
+    # Shapes inside a margin, like a logo on its padded canvas
+    mx, my = w // 10, h // 10
+    for _ in range(12):
+        x0, y0 = rng.randrange(mx, w - mx), rng.randrange(my, h - my)
+        x1, y1 = min(w - mx, x0 + rng.randrange(w // 20, w // 3)), min(h - my, y0 + rng.randrange(h // 20, h // 3))
+        fill = tuple(rng.randrange(256) for _ in range(3)) + (rng.randrange(128, 256),)
+        shape = rng.choice((draw.rectangle, draw.ellipse))
+        shape((x0, y0, x1, y1), fill=fill if transparent else fill[:3])
+    font = logic.get_font(None, max(12, h // 4))
+    draw.text((mx, h // 3), rng.choice(NAMES)[:12], font=font, fill=(20, 20, 20, 255) if not transparent else (250, 250, 250, 255))
+    buf = io.BytesIO()
+    if transparent:
+        img.save(buf, 'PNG')
+        return buf.getvalue(), 'png'
+    img.save(buf, 'JPEG', quality=90)
+    return buf.getvalue(), 'jpeg'
+
+
+def build_corpus(quick=False):
+    sizes = ('small', 'medium') if quick else tuple(SIZES)
+    corpus = {}
+    for size, aspect, transparent in itertools.product(sizes, ASPECTS, (True, False)):
+        data, _ = synthetic_logo(size, aspect, transparent)
+        corpus[f"{size}-{aspect}-{'alpha' if transparent else 'opaque'}"] = data
+    return corpus
+
+
+def transform_options(quick=False):
+    """Every combination of the transform switches, named like 'invert+tint'."""
+    axes = [('invert', {'invert': True}), ('make_white', {'make_white': True}), ('monochrome', {'monochrome': True}),
+            ('contrast', {'contrast': 1.4}), ('tint', {'tint': '#3fa7d6'}), ('zoom', {'apply_default_size': False, 'zoom': 1.2})]
+    combos = [()] + [(a,) for a in axes] if quick else \
+        [c for n in range(len(axes) + 1) for c in itertools.combinations(axes, n)]
+    out = {}
+    for combo in combos:
+        opts = {}
+        for _, o in combo:
+            opts.update(o)
+        out['+'.join(name for name, _ in combo) or 'default'] = opts
+    return out
+
+
+def font_paths(fonts_dir, limit):
+    fonts = {'builtin': None}
+    try:
+        names = sorted(n for n in os.listdir(fonts_dir) if n.lower().endswith(('.ttf', '.otf', '.woff', '.woff2')))
+    except OSError:
+        names = []
+    for name in names[:limit]:
+        fonts[os.path.splitext(name)[0]] = os.path.join(fonts_dir, name)
+    return fonts
+
+
+# Measurement
+
+def percentile(samples, p):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, max(0, int(round(p / 100 * len(ordered) + 0.5)) - 1))]
+
+
+def _live_peak_mb(pid):
+    # VmHWM is the peak resident set of a running process (Linux only)
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            return next(int(line.split()[1]) for line in f if line.startswith('VmHWM:')) / 1024
+    except (OSError, StopIteration, ValueError):
+        return 0.0
+
+
+def peak_rss_mb():
+    """Peak RSS of this process and of the largest child process.
+
+    RUSAGE_CHILDREN only covers children that have exited, so the transform
+    pool's workers, still running, are read from /proc.
+    """
+    # ru_maxrss is in KiB on Linux and bytes on macOS
+    scale = 1024 * 1024 if sys.platform == 'darwin' else 1024
+    self_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / scale
+    children = max([children] + [_live_peak_mb(p.pid) for p in multiprocessing.active_children()])
+    return round(self_rss, 1), round(children, 1)
+
+
+class Recorder:
+    def __init__(self, repeat, verbose=True):
+        self.repeat = repeat
+        self.verbose = verbose
+        self.results = []
+
+    def add(self, suite, case, samples, items=None, wall=None):
+        """Record latency samples (seconds); `items`/`wall` override throughput for batch cases."""
+        wall = wall if wall is not None else sum(samples)
+        items = items if items is not None else len(samples)
+        rss, children_rss = peak_rss_mb()
+        result = {
+            'suite': suite, 'case': case, 'n': items,
+            'seconds': round(wall, 4),
+            'throughput': round(items / wall, 2) if wall else None,
+            'p50_ms': round(percentile(samples, 50) * 1000, 3),
+            'p95_ms': round(percentile(samples, 95) * 1000, 3),
+            'peak_rss_mb': rss, 'peak_children_rss_mb': children_rss,
+        }
+        self.results.append(result)
+        if self.verbose:
+            print(f"{suite:<10} {case:<48} p50 {result['p50_ms']:>9.2f} ms  p95 {result['p95_ms']:>9.2f} ms  "
+                  f"{result['throughput'] or 0:>9.2f}/s  rss {rss:.0f} MB", flush=True)
+
+    def time(self, suite, case, fn, args_list):
+        samples = []
+        for _ in range(self.repeat):
+            for args in args_list:
+                t = time.perf_counter()
+                fn(*args)
+                samples.append(time.perf_counter() - t)
+        self.add(suite, case, samples)
+
+
+# Suites
+
+def bench_transforms(rec, corpus, options, engine):
+    decoded = {}
+    samples = []
+    for name, data in corpus.items():
+        for _ in range(rec.repeat):
+            t = time.perf_counter()
+            img = logic.open_source(io.BytesIO(data))
+            img.load()
+            samples.append(time.perf_counter() - t)
+        decoded[name] = img
+    rec.add('decode', 'all', samples)
+    for name, img in decoded.items():
+        rec.time('transform', f'default/{name}', lambda img: logic.apply_transforms(img, engine=engine), [(img.copy(),)])
+    for combo, opts in options.items():
+        rec.time('transform', combo, lambda img: logic.apply_transforms(img, engine=engine, **opts),
+                 [(img.copy(),) for img in decoded.values()])
+
+
+def bench_text(rec, fonts):
+    for font, path in fonts.items():
+        for rows in (1, 2, 3):
+            rec.time('text', f'{font}/rows={rows}', logic.generate_text_logo, [(n, path, rows) for n in NAMES])
+
+    def cold(name):
+        logic._load_font.cache_clear()
+        logic._line_bbox.cache_clear()
+        logic.generate_text_logo(name, None)
+    rec.time('text', 'builtin/cold-cache', cold, [(n,) for n in NAMES])
+
+
+def bench_save(rec, corpus, out_dir):
+    params = {'apply_default_size': True, 'contrast': 1.2}
+    kwargs = render_cache.transform_kwargs(params)
+
+    def save(name, data):
+        outputs = logic.process_logo_bytes(data, **kwargs)
+        render_cache.write_outputs(os.path.join(out_dir, name), outputs)
+    rec.time('save', 'uncached', save, list(corpus.items()))
+
+    for data in corpus.values():
+        render_cache.render(data, **params)
+    rec.time('save', 'render-cache-hit', lambda data: render_cache.render(data, **params), [(d,) for d in corpus.values()])
+
+    def save_custom(name):
+        outputs = logic.renditions(logic.generate_text_logo(name, None, 2))
+        render_cache.write_outputs(os.path.join(out_dir, 'custom'), outputs)
+    rec.time('save', 'custom-text', save_custom, [(n,) for n in NAMES])
+
+
+class FanartStandIn(BaseHTTPRequestHandler):
+    """Serves /music/<mbid> like fanart.tv and /logos/<n> with corpus images."""
+    logos = []
+    latency = 0.0
+
+    def do_GET(self):
+        time.sleep(self.latency)
+        parts = self.path.split('?')[0].strip('/').split('/')
+        if parts[0] == 'music':
+            n = int(parts[1].rsplit('-', 1)[1]) % len(self.logos)
+            host = f"http://{self.server.server_address[0]}:{self.server.server_address[1]}"
+            body, ctype = json.dumps({'hdmusiclogo': [{'url': f'{host}/logos/{n}'}]}).encode(), 'application/json'
+        elif parts[0] == 'logos':
+            body, ctype = self.logos[int(parts[1])], 'image/png'
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', ctype)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class _Guid:
+    def __init__(self, id):
+        self.id = id
+
+
+class FakeArtist:
+    latency = 0.0
+
+    def __init__(self, key):
+        self.ratingKey = key
+        self.title = f'Bench Artist {key}'
+        self.guids = [_Guid(f'mbid://bench-{key}')]
+
+    def uploadPoster(self, filepath=None):
+        time.sleep(self.latency)
+
+
+class FakePlex:
+    """Just enough of PlexServer for plex_utils.fetch_artist(s)."""
+    latency = 0.0
+
+    def query(self, path):
+        time.sleep(self.latency)
+        return path.split('/library/metadata/')[1].split('?')[0].split(',')
+
+    def findItems(self, data, initpath=None):
+        return [FakeArtist(k) for k in data]
+
+    def fetchItem(self, key):
+        time.sleep(self.latency)
+        return FakeArtist(str(key))
+
+
+def bench_pipeline(rec, corpus, artists, latency):
+    import plex_utils, pipeline
+    FanartStandIn.logos = list(corpus.values())
+    FanartStandIn.latency = FakePlex.latency = FakeArtist.latency = latency
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), FanartStandIn)
+    threading.Thread(target=httpd.serve_forever, daemon=True, name='bench-fanart').start()
+    plex_utils.FANART_API_URL = f'http://127.0.0.1:{httpd.server_address[1]}'
+    plex_utils.FANART_API_KEY = 'bench'
+    plex_utils.BASE_OUTPUT_DIR = os.path.join(SCRATCH, 'ArtistLogos')
+    plex_utils._server = FakePlex()
+    try:
+        keys = [str(k) for k in range(1, artists + 1)]
+        for case in ('cold', 'warm'):
+            # 'warm' reruns the same artists with every cache populated
+            samples, last = [], time.perf_counter()
+            start = last
+            for result in pipeline.run_bulk_apply(keys):
+                now = time.perf_counter()
+                samples.append(now - last)
+                last = now
+                if result['result'] != 'updated':
+                    print(f"pipeline: {result}", file=sys.stderr)
+            rec.add('pipeline', f'bulk-apply/{case}', samples, items=len(keys), wall=time.perf_counter() - start)
+    finally:
+        httpd.shutdown()
+
+
+# Comparison
+
+def compare(results, baseline_path, threshold):
+    """Print p50 changes against an earlier run; returns the cases that got slower than `threshold`."""
+    with open(baseline_path, 'r') as f:
+        baseline = {(r['suite'], r['case']): r for r in json.load(f)['results']}
+    regressions = []
+    print(f"\nCompared with {baseline_path}:")
+    for r in results:
+        old = baseline.get((r['suite'], r['case']))
+        if not old or not old['p50_ms']:
+            continue
+        change = r['p50_ms'] / old['p50_ms'] - 1
+        if abs(change) >= threshold:
+            flag = 'slower' if change > 0 else 'faster'
+            print(f"  {r['suite']:<10} {r['case']:<48} {old['p50_ms']:>9.2f} -> {r['p50_ms']:>9.2f} ms ({change:+.0%} {flag})")
+            if change > 0:
+                regressions.append(r)
+    if not regressions:
+        print(f"  no case more than {threshold:.0%} slower")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Offline benchmarks for the logo pipeline')
+    parser.add_argument('--out', default='benchmark-results.json', help='JSON results file (default: %(default)s)')
+    parser.add_argument('--suites', default='transforms,text,save,pipeline', help='comma separated suites to run')
+    parser.add_argument('--quick', action='store_true', help='smaller corpus and single-option transforms only')
+    parser.add_argument('--repeat', type=int, default=3, help='samples per input (default: %(default)s)')
+    parser.add_argument('--engine', default=logic.TRANSFORM_ENGINE, choices=('fused', 'pillow'))
+    parser.add_argument('--fonts-dir', default=logic.FONT_DIR, help='extra fonts to render with (default: %(default)s)')
+    parser.add_argument('--max-fonts', type=int, default=3)
+    parser.add_argument('--artists', type=int, default=100, help='artists in the pipeline suite (default: %(default)s)')
+    parser.add_argument('--latency', type=float, default=0.02, help='simulated Plex/fanart.tv latency in seconds')
+    parser.add_argument('--compare', metavar='JSON', help='earlier results to compare against')
+    parser.add_argument('--threshold', type=float, default=0.10, help='p50 change worth reporting (default: %(default)s)')
+    args = parser.parse_args(argv)
+
+    suites = {s.strip() for s in args.suites.split(',') if s.strip()}
+    rec = Recorder(args.repeat)
+    fonts = font_paths(args.fonts_dir, args.max_fonts)
+    try:
+        corpus = build_corpus(args.quick)
+        if 'transforms' in suites:
+            bench_transforms(rec, corpus, transform_options(args.quick), args.engine)
+        if 'text' in suites:
+            bench_text(rec, fonts)
+        if 'save' in suites:
+            bench_save(rec, corpus, os.path.join(SCRATCH, 'out'))
+        if 'pipeline' in suites:
+            bench_pipeline(rec, corpus, args.artists, args.latency)
+    finally:
+        shutil.rmtree(SCRATCH, ignore_errors=True)
+
+    report = {
+        'meta': {
+            'created_at': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'python': platform.python_version(), 'pillow': Image.__version__,
+            'platform': platform.platform(), 'cpus': os.cpu_count(),
+            'engine': args.engine, 'quick': args.quick, 'repeat': args.repeat,
+            'fonts': sorted(fonts), 'corpus': sorted(corpus),
+            'artists': args.artists, 'latency': args.latency,
+        },
+        'results': rec.results,
+    }
+    with open(args.out, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote {len(rec.results)} results to {args.out}")
+    if args.compare:
+        return 1 if compare(rec.results, args.compare, args.threshold) else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
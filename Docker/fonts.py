@@ -0,0 +1,215 @@
+import os, re, json, hashlib, threading
+from concurrent.futures import ThreadPoolExecutor
+import plex_utils, logic, locks
+
+# Fonts for the text generator live in FONT_DIR, described by a manifest
+# (family -> file, format, size, checksum) that is read once at startup.
+# Missing families are downloaded from Google Fonts in the background, so
+# the server never waits on a font it doesn't need yet. In offline mode
+# only fonts already in the directory are used.
+MANIFEST_FILE = os.path.join(logic.FONT_DIR, 'manifest.json')
+OFFLINE = os.environ.get('FONTS_OFFLINE', 'false').lower() == 'true'
+DOWNLOAD_WORKERS = int(os.environ.get('FONT_DOWNLOAD_WORKERS', 4))
+FORMATS = {'.ttf': 'truetype', '.otf': 'opentype', '.woff': 'woff', '.woff2': 'woff2'}
+USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110 Safari/537.36'
+
+_manifest = {}
+_pending = {}
+# Families whose recorded file failed verification; downloaded again rather
+# than adopted from the directory
+_rejected = set()
+_loaded = False
+_lock = threading.Lock()
+_executor = ThreadPoolExecutor(max_workers=DOWNLOAD_WORKERS, thread_name_prefix='font-download')
+
+
+def _basename(family):
+    return f"{family.replace(' ', '')}-Regular"
+
+
+def _checksum(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(64 * 1024), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _entry(path):
+    ext = os.path.splitext(path)[1].lower()
+    return {'file': os.path.basename(path), 'format': FORMATS.get(ext, 'truetype'),
+            'size': os.path.getsize(path), 'sha256': _checksum(path)}
+
+
+def _read_manifest():
+    try:
+        with open(MANIFEST_FILE, 'r') as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def _valid(entry, verify=False):
+    """True if the entry's file exists with the recorded size and, with `verify`, checksum."""
+    path = os.path.join(logic.FONT_DIR, entry.get('file', ''))
+    if not os.path.isfile(path) or os.path.getsize(path) != entry.get('size'):
+        return False
+    return not verify or _checksum(path) == entry.get('sha256')
+
+
+def _adopt(family):
+    # Called with _lock held: add `<Family>-Regular.<ext>` to the manifest if
+    # it is in the font directory; returns whether it was
+    if family in _rejected:
+        return False
+    for ext in FORMATS:
+        f_path = os.path.join(logic.FONT_DIR, _basename(family) + ext)
+        if os.path.isfile(f_path):
+            _manifest[family] = _entry(f_path)
+            return True
+    return False
+
+
+def _save_manifest():
+    # Other worker processes may have added fonts since this one read the
+    # manifest; keep theirs and pick them up here too
+    os.makedirs(logic.FONT_DIR, exist_ok=True)
+    with locks.file_lock('font-manifest'):
+        for family, entry in _read_manifest().items():
+            if family not in _manifest and _valid(entry, verify=True):
+                _manifest[family] = entry
+        tmp = f'{MANIFEST_FILE}.{os.getpid()}.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(_manifest, f, indent=2, sort_keys=True)
+        os.replace(tmp, MANIFEST_FILE)
+
+
+def load(families=()):
+    """Read the manifest and reconcile it with the font directory.
+
+    Entries whose file is gone or no longer matches its size and checksum
+    are dropped (and downloaded again). Files named like
+    `<Family>-Regular.ttf` that the manifest doesn't know yet (from older
+    versions or a pre-populated directory) are added for `families`, and
+    for any other family when path() first asks for it.
+    """
+    global _loaded
+    with _lock:
+        manifest = _read_manifest()
+        changed = False
+        for family, entry in list(manifest.items()):
+            if not _valid(entry, verify=True):
+                del manifest[family]
+                _rejected.add(family)
+                changed = True
+        _manifest.clear()
+        _manifest.update(manifest)
+        for family in families:
+            if family not in _manifest and _adopt(family):
+                changed = True
+        _loaded = True
+        if changed:
+            _save_manifest()
+
+
+def path(family):
+    """Return the local file for `family`, or None if it isn't available (yet)."""
+    if not _loaded:
+        load([family])
+    entry = _manifest.get(family)
+    if entry is None:
+        with _lock:
+            if _adopt(family):
+                _save_manifest()
+            entry = _manifest.get(family)
+    return os.path.join(logic.FONT_DIR, entry['file']) if entry else None
+
+
+def ensure(family, timeout=0):
+    """Return the local file for `family`, downloading it in the background if needed.
+
+    Waits up to `timeout` seconds for a download to finish; returns None if
+    the font is still missing, so callers can fall back to the default font.
+    """
+    found = path(family)
+    if found or OFFLINE:
+        return found
+    with _lock:
+        fut = _pending.get(family)
+        if fut is None:
+            fut = _pending[family] = _executor.submit(_download, family)
+    try:
+        return fut.result(timeout=timeout) if timeout else None
+    except Exception:
+        return None
+
+
+def start(families):
+    """Load the manifest and queue downloads for any missing families. Doesn't block."""
+    load(families)
+    if OFFLINE:
+        missing = [f for f in families if f not in _manifest]
+        if missing:
+            print(f"Offline mode: fonts not available locally: {', '.join(missing)}")
+        return
+    for family in families:
+        ensure(family)
+
+
+def status():
+    """Return {'available': [...], 'downloading': [...]} for the UI."""
+    with _lock:
+        downloading = [f for f, fut in _pending.items() if not fut.done()]
+    return {'available': sorted(_manifest), 'downloading': sorted(downloading), 'offline': OFFLINE}
+
+
+def _download(family):
+    """Fetch the regular weight of `family` from Google Fonts and record it in the manifest.
+
+    Only one process downloads a family; the others wait and then use its file.
+    """
+    try:
+        with locks.file_lock(f'font-{_basename(family)}'):
+            entry = _read_manifest().get(family)
+            if entry and _valid(entry, verify=True):
+                with _lock:
+                    _manifest[family] = entry
+                return os.path.join(logic.FONT_DIR, entry['file'])
+            return _fetch(family)
+    except Exception as e:
+        print(f"Error downloading font '{family}': {e}")
+        return None
+    finally:
+        with _lock:
+            _pending.pop(family, None)
+
+
+def _fetch(family):
+    css_url = f"https://fonts.googleapis.com/css2?family={family.replace(' ', '+')}:wght@400&display=swap"
+    css_response = plex_utils.session.get(css_url, headers={'User-Agent': USER_AGENT}, timeout=15)
+    css_response.raise_for_status()
+
+    font_urls = re.findall(r"url\((http.*?)\)", css_response.text)
+    if not font_urls:
+        print(f"Could not find any font URL in the CSS for '{family}'.")
+        return None
+    # The last URL is usually the basic latin subset
+    font_url = font_urls[-1]
+    ext = next((e for e in ('.woff2', '.woff', '.otf') if e in font_url), '.ttf')
+
+    font_response = plex_utils.session.get(font_url, timeout=30)
+    font_response.raise_for_status()
+
+    os.makedirs(logic.FONT_DIR, exist_ok=True)
+    f_path = os.path.join(logic.FONT_DIR, _basename(family) + ext)
+    tmp = f_path + '.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(font_response.content)
+    os.replace(tmp, f_path)
+
+    with _lock:
+        _manifest[family] = _entry(f_path)
+        _rejected.discard(family)
+        _save_manifest()
+    print(f"Downloaded font '{family}' to '{f_path}'.")
+    return f_path
@@ -0,0 +1,20 @@
+import os
+
+# Many threads per process: image proxying and Plex calls spend their time
+# waiting on the network. WEB_WORKERS > 1 adds processes for CPU-bound work
+# (previews, saves); caches, job state and artist files are shared through
+# the data volume, and only one process runs bulk jobs at a time.
+bind = f"0.0.0.0:{os.environ.get('PORT', 5000)}"
+workers = int(os.environ.get('WEB_WORKERS', 1))
+worker_class = 'gthread'
+threads = int(os.environ.get('WEB_THREADS', 32))
+timeout = int(os.environ.get('WEB_TIMEOUT', 120))
+keepalive = 5
+accesslog = None
+errorlog = '-'
+
+
+def on_starting(server):
+    # Metrics shared between workers start again from zero with the server
+    import metrics
+    metrics.clear_shared()
@@ -0,0 +1,240 @@
+import os, time, uuid, sqlite3, hashlib, threading
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+from contextlib import closing
+from kvcache import CACHE_DIR
+import plex_utils, metrics
+
+# Remote images (fanart.tv logos, Plex posters) are cached on disk by content
+# hash. The URL index remembers ETag/Last-Modified so stale entries are
+# revalidated with a conditional request instead of downloaded again. Plex
+# URLs are indexed without their X-Plex-Token, which stays off disk and can
+# change without invalidating the cache.
+BLOB_DIR = os.path.join(CACHE_DIR, 'blobs')
+INDEX_DB = os.path.join(CACHE_DIR, 'images.db')
+MAX_BYTES = int(os.environ.get('IMAGE_CACHE_MAX_BYTES', 1024 ** 3))
+REVALIDATE_AFTER = int(os.environ.get('IMAGE_CACHE_REVALIDATE', 3600))
+# Concurrent downloads per origin host, so a page full of thumbnails can't
+# open more connections to fanart.tv or Plex than the pool holds
+HOST_CONNECTIONS = int(os.environ.get('IMAGE_FETCH_HOST_CONNECTIONS', 8))
+
+_ready = False
+_evict_lock = threading.Lock()
+_host_slots = {}
+_host_slots_lock = threading.Lock()
+
+
+class CachedImage:
+    def __init__(self, path, digest, content_type):
+        self.path = path
+        self.digest = digest
+        self.content_type = content_type
+
+    def read(self):
+        with open(self.path, 'rb') as f:
+            return f.read()
+
+
+def _connect():
+    global _ready
+    if not _ready:
+        os.makedirs(BLOB_DIR, exist_ok=True)
+    conn = sqlite3.connect(INDEX_DB, timeout=30)
+    conn.row_factory = sqlite3.Row
+    if not _ready:
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.executescript('''
+            CREATE TABLE IF NOT EXISTS urls (
+                url TEXT PRIMARY KEY,
+                digest TEXT NOT NULL,
+                content_type TEXT,
+                etag TEXT,
+                last_modified TEXT,
+                checked_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS blobs (
+                digest TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                accessed_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS blobs_accessed ON blobs (accessed_at);
+        ''')
+        # Entries indexed with their token by earlier versions
+        with conn:
+            conn.execute("DELETE FROM urls WHERE url LIKE '%X-Plex-Token=%'")
+        _ready = True
+    return conn
+
+
+def _index_key(url):
+    """`url` as stored in the index: without an X-Plex-Token query parameter."""
+    parts = urlsplit(url)
+    if 'x-plex-token=' not in parts.query.lower():
+        return url
+    query = [(k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True) if k.lower() != 'x-plex-token']
+    return urlunsplit(parts._replace(query=urlencode(query)))
+
+
+def _blob_path(digest):
+    return os.path.join(BLOB_DIR, digest[:2], digest)
+
+
+def _host_slot(url):
+    host = urlsplit(url).netloc
+    with _host_slots_lock:
+        if host not in _host_slots:
+            _host_slots[host] = threading.BoundedSemaphore(HOST_CONNECTIONS)
+        return _host_slots[host]
+
+
+class StreamedImage:
+    """A download in progress, passed through chunk by chunk while it is cached.
+
+    Iterating yields the body; once it has been read completely the image is
+    filed in the cache and `cached` holds the CachedImage. If iteration stops
+    early the partial download is discarded.
+    """
+    def __init__(self, url, response, slot):
+        self.url = url
+        self.content_type = response.headers.get('Content-Type') or 'image/jpeg'
+        # Only known up front if requests won't be decompressing the body
+        self.content_length = None if response.headers.get('Content-Encoding') else response.headers.get('Content-Length')
+        self.cached = None
+        self._response = response
+        self._slot = slot
+        self._closed = False
+        self._started = time.perf_counter()
+
+    def __iter__(self):
+        r = self._response
+        os.makedirs(BLOB_DIR, exist_ok=True)
+        tmp = os.path.join(BLOB_DIR, f'.tmp-{uuid.uuid4().hex}')
+        h = hashlib.sha256()
+        size = 0
+        try:
+            with open(tmp, 'wb') as f:
+                for chunk in r.iter_content(chunk_size=64 * 1024):
+                    h.update(chunk)
+                    f.write(chunk)
+                    size += len(chunk)
+                    yield chunk
+            self.cached = _store(self.url, r, tmp, h.hexdigest(), size)
+            metrics.observe('stage_seconds', time.perf_counter() - self._started, stage='image_download')
+        finally:
+            self.close()
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+    def close(self):
+        """Give up the download (if unfinished) and free the host slot. Safe to call twice."""
+        if not self._closed:
+            self._closed = True
+            self._response.close()
+            self._slot.release()
+
+    def finish(self):
+        """Read the rest of the download and return the CachedImage."""
+        for _ in self:
+            pass
+        return self.cached
+
+
+def open_url(url, timeout=30):
+    """Return a CachedImage if `url` is cached and fresh (or unchanged), else a StreamedImage.
+
+    Raises requests exceptions if the image can't be fetched and isn't cached.
+    """
+    with closing(_connect()) as conn:
+        row = conn.execute('SELECT * FROM urls WHERE url = ?', (_index_key(url),)).fetchone()
+    if row and not os.path.exists(_blob_path(row['digest'])):
+        row = None
+
+    if row and time.time() - row['checked_at'] < REVALIDATE_AFTER:
+        metrics.cache('image', True)
+        return _hit(row, touch_url=False)
+
+    headers = {}
+    if row and row['etag']:
+        headers['If-None-Match'] = row['etag']
+    if row and row['last_modified']:
+        headers['If-Modified-Since'] = row['last_modified']
+
+    slot = _host_slot(url)
+    slot.acquire()
+    try:
+        with metrics.external('image'):
+            r = plex_utils.session.get(url, headers=headers, timeout=timeout, stream=True)
+        if r.status_code == 304 and row:
+            r.close()
+            slot.release()
+            metrics.cache('image', 'revalidated')
+            return _hit(row, touch_url=True)
+        r.raise_for_status()
+    except Exception:
+        slot.release()
+        if row:
+            metrics.cache('image', 'stale')
+            return _hit(row, touch_url=False)
+        raise
+    metrics.cache('image', False)
+    return StreamedImage(url, r, slot)
+
+
+def lookup(url):
+    """Return a CachedImage for `url` if it is cached, however old, without any request; else None."""
+    with closing(_connect()) as conn:
+        row = conn.execute('SELECT * FROM urls WHERE url = ?', (_index_key(url),)).fetchone()
+    if row and os.path.exists(_blob_path(row['digest'])):
+        return CachedImage(_blob_path(row['digest']), row['digest'], row['content_type'])
+    return None
+
+
+def fetch(url, timeout=30):
+    """Return a CachedImage for `url`, downloading or revalidating as needed.
+
+    Raises requests exceptions if the image can't be fetched and isn't cached.
+    """
+    result = open_url(url, timeout)
+    return result.finish() if isinstance(result, StreamedImage) else result
+
+
+def _hit(row, touch_url):
+    now = time.time()
+    with closing(_connect()) as conn, conn:
+        conn.execute('UPDATE blobs SET accessed_at = ? WHERE digest = ?', (now, row['digest']))
+        if touch_url:
+            conn.execute('UPDATE urls SET checked_at = ? WHERE url = ?', (now, row['url']))
+    return CachedImage(_blob_path(row['digest']), row['digest'], row['content_type'])
+
+
+def _store(url, r, tmp, digest, size):
+    """File a completed download under its content hash."""
+    path = _blob_path(digest)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    os.replace(tmp, path)
+
+    content_type = r.headers.get('Content-Type') or 'image/jpeg'
+    now = time.time()
+    with closing(_connect()) as conn, conn:
+        conn.execute('INSERT OR REPLACE INTO urls VALUES (?, ?, ?, ?, ?, ?)',
+                     (_index_key(url), digest, content_type, r.headers.get('ETag'), r.headers.get('Last-Modified'), now))
+        conn.execute('INSERT OR REPLACE INTO blobs VALUES (?, ?, ?)', (digest, size, now))
+    _evict()
+    return CachedImage(path, digest, content_type)
+
+
+def _evict():
+    """Drop least recently used blobs until the cache fits in MAX_BYTES."""
+    with _evict_lock, closing(_connect()) as conn, conn:
+        total = conn.execute('SELECT COALESCE(SUM(size), 0) FROM blobs').fetchone()[0]
+        if total <= MAX_BYTES:
+            return
+        for row in conn.execute('SELECT digest, size FROM blobs ORDER BY accessed_at').fetchall():
+            if total <= MAX_BYTES:
+                break
+            conn.execute('DELETE FROM blobs WHERE digest = ?', (row['digest'],))
+            conn.execute('DELETE FROM urls WHERE digest = ?', (row['digest'],))
+            try:
+                os.remove(_blob_path(row['digest']))
+            except FileNotFoundError:
+                pass
+            total -= row['size']
@@ -0,0 +1,302 @@
+import os, json, time, uuid, sqlite3, threading
+from contextlib import closing
+import plex_utils, metrics, locks
+
+# Bulk jobs are persisted so they survive browser disconnects and container
+# restarts. One row per job plus one row per artist in it; finished artists are
+# never reprocessed when a job is resumed.
+JOBS_DB = os.environ.get('JOBS_DB', os.path.join(plex_utils.BASE_OUTPUT_DIR, 'jobs.db'))
+# Every worker process starts a runner thread, but only the one holding the
+# runner lock executes jobs; the others wait to take over if it exits. Jobs
+# submitted in another process are noticed within JOB_POLL_INTERVAL seconds.
+JOB_POLL_INTERVAL = float(os.environ.get('JOB_POLL_INTERVAL', 2))
+
+_handlers = {}
+_wakeup = threading.Event()
+_runner = None
+_runner_lock = threading.Lock()
+_db_ready = False
+# Job locks taken by submit()/resume() for run() in this process, held from
+# before the job is marked running so no runner can take it as abandoned
+_held = {}
+
+
+def _connect():
+    os.makedirs(os.path.dirname(JOBS_DB), exist_ok=True)
+    conn = sqlite3.connect(JOBS_DB, timeout=30)
+    conn.row_factory = sqlite3.Row
+    conn.execute('PRAGMA journal_mode=WAL')
+    return conn
+
+
+def init_db():
+    global _db_ready
+    if _db_ready:
+        return
+    with closing(_connect()) as conn, conn:
+        conn.executescript('''
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                status TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS job_items (
+                job_id TEXT NOT NULL,
+                artist_key TEXT NOT NULL,
+                state TEXT NOT NULL DEFAULT 'pending',
+                result TEXT,
+                seq INTEGER,
+                PRIMARY KEY (job_id, artist_key)
+            );
+            CREATE INDEX IF NOT EXISTS job_items_seq ON job_items (job_id, seq);
+        ''')
+    _db_ready = True
+
+
+def register(kind, handler):
+    """Register a job kind.
+
+    `handler(artist_keys, should_stop)` must yield one result dict per artist
+    with at least 'key' and 'result' ('updated', 'error', ...).
+    """
+    _handlers[kind] = handler
+
+
+def submit(kind, artist_keys, background=True):
+    """Record a new job and return its id.
+
+    Jobs are picked up by the background runner. With `background=False` the
+    job is marked running instead, for the caller to execute with run().
+    """
+    if kind not in _handlers:
+        raise ValueError(f"unknown job kind '{kind}'")
+    if background:
+        start()
+    else:
+        init_db()
+    job_id = uuid.uuid4().hex
+    if not background:
+        _held[job_id] = locks.acquire(f'job-{job_id}')
+    now = time.time()
+    with closing(_connect()) as conn, conn:
+        conn.execute('INSERT INTO jobs VALUES (?, ?, ?, ?, ?)', (job_id, kind, 'queued' if background else 'running', now, now))
+        conn.executemany('INSERT OR IGNORE INTO job_items (job_id, artist_key) VALUES (?, ?)',
+                         [(job_id, str(k)) for k in artist_keys])
+    if background:
+        _wakeup.set()
+    return job_id
+
+
+def run(job_id, on_result=None):
+    """Run a job in the calling thread (see submit). Returns the final status.
+
+    `on_result(result)` is called for each artist as it finishes.
+    """
+    job = get(job_id)
+    if not job:
+        raise ValueError(f"unknown job '{job_id}'")
+    if job['kind'] not in _handlers:
+        raise ValueError(f"unknown job kind '{job['kind']}'")
+    _run_job(job, on_result)
+    return _status(job_id)
+
+
+def get(job_id):
+    """Return a job with per-state item counts, or None."""
+    init_db()
+    with closing(_connect()) as conn:
+        job = conn.execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        if not job:
+            return None
+        counts = dict(conn.execute('SELECT state, COUNT(*) FROM job_items WHERE job_id = ? GROUP BY state', (job_id,)).fetchall())
+    out = dict(job)
+    out['counts'] = counts
+    out['total'] = sum(counts.values())
+    out['updated_count'] = counts.get('updated', 0)
+    return out
+
+
+def list_jobs(limit=50):
+    init_db()
+    with closing(_connect()) as conn:
+        rows = conn.execute('SELECT id FROM jobs ORDER BY created_at DESC LIMIT ?', (limit,)).fetchall()
+    return [get(r['id']) for r in rows]
+
+
+def results_since(job_id, seq=0):
+    """Return finished item results with a sequence number above `seq`."""
+    with closing(_connect()) as conn:
+        rows = conn.execute('SELECT result, seq FROM job_items WHERE job_id = ? AND seq > ? ORDER BY seq',
+                            (job_id, seq)).fetchall()
+    return [(r['seq'], json.loads(r['result'])) for r in rows]
+
+
+def cancel(job_id):
+    return _set_status(job_id, 'cancelled', only_from=('queued', 'running'))
+
+
+def resume(job_id, background=True):
+    """Requeue a cancelled, failed or finished job; errored artists are retried.
+
+    A job still marked running that no process is running (e.g. a killed CLI
+    run) can be resumed too. With `background=False` the job is marked
+    running for run() instead.
+    """
+    init_db()
+    lock = locks.acquire(f'job-{job_id}', blocking=False)
+    if lock is None and not background:
+        return False
+    resumable = ('cancelled', 'failed', 'completed') + (('running',) if lock else ())
+    ok = False
+    try:
+        with closing(_connect()) as conn, conn:
+            conn.execute("UPDATE job_items SET state = 'pending', result = NULL, seq = NULL WHERE job_id = ? AND state = 'error'", (job_id,))
+        ok = _set_status(job_id, 'queued' if background else 'running', only_from=resumable)
+    finally:
+        if lock and not (ok and not background):
+            lock.close()
+    if ok and not background:
+        _held[job_id] = lock
+    if ok and background:
+        start()
+        _wakeup.set()
+    return ok
+
+
+def _set_status(job_id, status, only_from=None):
+    with closing(_connect()) as conn, conn:
+        q = 'UPDATE jobs SET status = ?, updated_at = ? WHERE id = ?'
+        args = [status, time.time(), job_id]
+        if only_from:
+            q += f" AND status IN ({','.join('?' * len(only_from))})"
+            args += list(only_from)
+        return conn.execute(q, args).rowcount > 0
+
+
+def _status(job_id):
+    with closing(_connect()) as conn:
+        row = conn.execute('SELECT status FROM jobs WHERE id = ?', (job_id,)).fetchone()
+    return row['status'] if row else None
+
+
+def _record(conn, job_id, result):
+    state = result.get('result', 'error')
+    conn.execute('''UPDATE job_items SET state = ?, result = ?,
+                    seq = (SELECT COALESCE(MAX(seq), 0) + 1 FROM job_items WHERE job_id = ?)
+                    WHERE job_id = ? AND artist_key = ?''',
+                 (state, json.dumps(result), job_id, job_id, str(result['key'])))
+
+
+def _run_job(job, on_result=None):
+    """Run a job unless another process is running it; returns False in that case."""
+    # Held while the job runs, so a runner starting up elsewhere can tell a
+    # running job from one left behind by a process that exited
+    lock = _held.pop(job['id'], None) or locks.acquire(f"job-{job['id']}", blocking=False)
+    if lock is None:
+        print(f"Job {job['id']} is already running in another process")
+        return False
+    try:
+        _execute(job, on_result)
+    finally:
+        lock.close()
+    return True
+
+
+def _execute(job, on_result=None):
+    job_id = job['id']
+    with closing(_connect()) as conn:
+        keys = [r['artist_key'] for r in conn.execute(
+            "SELECT artist_key FROM job_items WHERE job_id = ? AND state = 'pending'", (job_id,))]
+    # run() callers find the job already running; anything else (a cancel
+    # since it was picked up) means it must not start
+    if not _set_status(job_id, 'running', only_from=('queued', 'running')):
+        print(f"Job {job_id} was {_status(job_id)} before it started")
+        return
+    started = time.time()
+
+    last_check = [0.0, False]
+    def should_stop():
+        # Cancellation is polled at most once a second
+        if time.time() - last_check[0] > 1.0:
+            last_check[:] = [time.time(), _status(job_id) == 'cancelled']
+        return last_check[1]
+
+    try:
+        with closing(_connect()) as conn:
+            # Results are committed in batches rather than one transaction each
+            pending, last_commit = 0, time.time()
+            for result in _handlers[job['kind']](keys, should_stop):
+                _record(conn, job_id, result)
+                if on_result:
+                    on_result(result)
+                pending += 1
+                if pending >= 100 or time.time() - last_commit > 0.5:
+                    conn.commit()
+                    pending, last_commit = 0, time.time()
+            conn.commit()
+    except Exception as e:
+        metrics.error('job', f"Job {job_id} failed: {e}", job_id=job_id, kind=job['kind'])
+        _set_status(job_id, 'failed', only_from=('running',))
+        return
+    _set_status(job_id, 'completed', only_from=('running',))
+    metrics.log('job_finished', job_id=job_id, kind=job['kind'], status=_status(job_id),
+                artists=len(keys), seconds=round(time.time() - started, 3))
+
+
+def abandoned(job_id):
+    """True if no process holds the job's lock, i.e. a 'running' job was left behind by one that exited."""
+    if job_id in _held:
+        return False
+    with locks.file_lock(f'job-{job_id}', blocking=False) as free:
+        return free
+
+
+def _requeue_orphans():
+    """Queue again jobs left 'running' by a process that exited (e.g. a restart)."""
+    with closing(_connect()) as conn:
+        running = [r['id'] for r in conn.execute("SELECT id FROM jobs WHERE status = 'running'")]
+    for job_id in running:
+        with locks.file_lock(f'job-{job_id}', blocking=False) as orphaned:
+            if orphaned:
+                _set_status(job_id, 'queued', only_from=('running',))
+
+
+def _loop():
+    # Exactly one runner across worker processes; the lock is held for good
+    leader = locks.acquire('job-runner', blocking=False)
+    while leader is None:
+        time.sleep(JOB_POLL_INTERVAL * 5)
+        leader = locks.acquire('job-runner', blocking=False)
+    _requeue_orphans()
+    # Queued jobs still held by another process (e.g. a cancelled CLI run
+    # finishing its in-flight artists), left alone until JOB_POLL_INTERVAL passes
+    busy = {}
+    while True:
+        now = time.time()
+        with closing(_connect()) as conn:
+            queued = conn.execute("SELECT * FROM jobs WHERE status = 'queued' ORDER BY created_at").fetchall()
+        job = next((j for j in queued if now - busy.get(j['id'], 0) >= JOB_POLL_INTERVAL), None)
+        if not job:
+            _wakeup.wait(timeout=JOB_POLL_INTERVAL)
+            _wakeup.clear()
+            continue
+        if job['kind'] not in _handlers:
+            _set_status(job['id'], 'failed')
+            continue
+        if _run_job(dict(job)):
+            busy.pop(job['id'], None)
+        else:
+            busy[job['id']] = time.time()
+
+
+def start():
+    """Start the background job runner, resuming jobs interrupted by a restart."""
+    global _runner
+    with _runner_lock:
+        if _runner and _runner.is_alive():
+            return
+        init_db()
+        _runner = threading.Thread(target=_loop, daemon=True, name='job-runner')
+        _runner.start()
@@ -0,0 +1,70 @@
+import os, json, time, sqlite3, threading
+from contextlib import closing
+
+CACHE_DIR = os.environ.get('CACHE_DIR', '/app/ArtistLogos/.cache')
+
+
+class DiskCache:
+    """Small persistent key/value cache backed by SQLite.
+
+    Values are stored as JSON together with the time they were stored, so
+    callers can apply their own freshness rules. The least recently used
+    entries are evicted once `max_entries` is exceeded.
+    """
+
+    def __init__(self, name, max_entries=10000):
+        self.path = os.path.join(CACHE_DIR, f'{name}.db')
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._ready = False
+        self._writes = 0
+
+    def _connect(self):
+        if not self._ready:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=30)
+        if not self._ready:
+            with self._lock:
+                conn.execute('PRAGMA journal_mode=WAL')
+                conn.execute('''CREATE TABLE IF NOT EXISTS entries (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    stored_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL
+                )''')
+                conn.execute('CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed_at)')
+                self._ready = True
+        return conn
+
+    def get(self, key):
+        """Return (value, stored_at) or None."""
+        try:
+            with closing(self._connect()) as conn, conn:
+                row = conn.execute('SELECT value, stored_at FROM entries WHERE key = ?', (key,)).fetchone()
+                if not row:
+                    return None
+                conn.execute('UPDATE entries SET accessed_at = ? WHERE key = ?', (time.time(), key))
+            return json.loads(row[0]), row[1]
+        except sqlite3.Error as e:
+            print(f"Cache read error ({self.path}): {e}")
+            return None
+
+    def set(self, key, value):
+        now = time.time()
+        try:
+            with closing(self._connect()) as conn, conn:
+                conn.execute('INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?)', (key, json.dumps(value), now, now))
+                self._writes += 1
+                # Trimming needs a scan, so only do it every so often
+                if self._writes % 100 == 0:
+                    conn.execute('''DELETE FROM entries WHERE key IN (
+                        SELECT key FROM entries ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)''', (self.max_entries,))
+        except sqlite3.Error as e:
+            print(f"Cache write error ({self.path}): {e}")
+
+    def delete(self, key):
+        try:
+            with closing(self._connect()) as conn, conn:
+                conn.execute('DELETE FROM entries WHERE key = ?', (key,))
+        except sqlite3.Error as e:
+            print(f"Cache write error ({self.path}): {e}")
@@ -0,0 +1,40 @@
+import os, fcntl, hashlib
+from contextlib import contextmanager
+from kvcache import CACHE_DIR
+
+# Advisory file locks shared by every process using the same data volume:
+# gunicorn workers (WEB_WORKERS), the batch CLI and their transform pools.
+# A lock is released when its file is closed, including when the holder dies.
+LOCK_DIR = os.environ.get('LOCK_DIR', os.path.join(CACHE_DIR, 'locks'))
+
+
+def _open(name):
+    os.makedirs(LOCK_DIR, exist_ok=True)
+    return open(os.path.join(LOCK_DIR, f'{name}.lock'), 'a')
+
+
+def acquire(name, blocking=True):
+    """Take the lock `name`; returns the open lock file (close it to release), or None if busy and not `blocking`."""
+    f = _open(name)
+    try:
+        fcntl.flock(f, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        f.close()
+        return None
+    return f
+
+
+@contextmanager
+def file_lock(name, blocking=True):
+    """Hold the lock `name` for the block; yields False instead if it is busy and not `blocking`."""
+    f = acquire(name, blocking)
+    try:
+        yield f is not None
+    finally:
+        if f:
+            f.close()
+
+
+def path_lock_name(path):
+    """Lock name for a file or folder, e.g. an artist's output folder."""
+    return 'path-' + hashlib.sha1(os.path.abspath(path).encode()).hexdigest()[:20]
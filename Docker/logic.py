@@ -1,10 +1,138 @@
-import os, base64, requests
+import os, base64, requests, threading
+from functools import lru_cache
 from PIL import Image, ImageOps, ImageDraw, ImageFont, ImageEnhance, ImageChops
 from io import BytesIO
+import struct
+import metrics
 
-FONT_DIR = '/app/fonts'
+FONT_DIR = os.environ.get('FONT_DIR', '/app/fonts')
+CANVAS_SIDE = 1000
 
-def apply_transforms(img, apply_default_size=True, invert=False, make_white=False, contrast=1.0, zoom=1.0, monochrome=False, tint=None):
+# 'fused' collapses the per-pixel effects into single lookup-table passes;
+# 'pillow' is the original chain of Pillow operations. Both give identical output.
+TRANSFORM_ENGINE = os.environ.get('TRANSFORM_ENGINE', 'fused')
+
+# Output encoding. Every save writes one file per rendition size, all resized
+# from the same full-size canvas; the CANVAS_SIDE rendition is `artist.<ext>`,
+# smaller ones `artist-<size>.<ext>`.
+OUTPUT_FORMATS = {
+    'jpeg': ('JPEG', '.jpg', {}),
+    'progressive': ('JPEG', '.jpg', {'progressive': True, 'optimize': True}),
+    'webp': ('WEBP', '.webp', {'method': 4}),
+    'png': ('PNG', '.png', {}),
+}
+OUTPUT_FORMAT = os.environ.get('OUTPUT_FORMAT', 'jpeg').lower()
+if OUTPUT_FORMAT not in OUTPUT_FORMATS:
+    print(f"Unknown OUTPUT_FORMAT '{OUTPUT_FORMAT}', using jpeg")
+    OUTPUT_FORMAT = 'jpeg'
+OUTPUT_QUALITY = int(os.environ.get('OUTPUT_QUALITY', 95))
+# Rendition sent to Plex when UPDATE_PLEX is on
+UPLOAD_SIZE = int(os.environ.get('PLEX_UPLOAD_SIZE', CANVAS_SIDE))
+RENDITIONS = sorted({CANVAS_SIDE, UPLOAD_SIZE, *(int(v) for v in os.environ.get('OUTPUT_RENDITIONS', '').split(',') if v.strip())}, reverse=True)
+
+# Sources above this many pixels are refused outright; larger ones are
+# shrunk before processing so effects run close to output resolution.
+MAX_SOURCE_PIXELS = int(os.environ.get('MAX_SOURCE_PIXELS', 64_000_000))
+REDUCING_GAP = 2
+Image.MAX_IMAGE_PIXELS = MAX_SOURCE_PIXELS
+
+# Text logos are measured at a small reference size, then rendered at the size
+# that fills the same 80% of the canvas apply_transforms fits logos into.
+TEXT_TARGET = int(CANVAS_SIDE * 0.8)
+TEXT_MEASURE_SIZE = 100
+LINE_GAP = 0.125  # gap between lines, relative to the font size
+FONT_CACHE_SIZE = int(os.environ.get('FONT_CACHE_SIZE', 64))
+
+
+def _parse_tint(tint):
+    """Parse '#RGB' / '#RRGGBB' into an (r, g, b) tuple, or None."""
+    if not tint:
+        return None
+    try:
+        h = str(tint).lstrip('#')
+        if len(h) == 3:
+            h = ''.join([c*2 for c in h])
+        if len(h) == 6:
+            return int(h[0:2], 16), int(h[2:4], 16), int(h[4:6], 16)
+    except Exception:
+        # If parsing fails, silently ignore tint
+        pass
+    return None
+
+
+def _output_size(width, height, apply_default_size, zoom, canvas_side=CANVAS_SIDE):
+    if apply_default_size:
+        # Fit into 80% of canvas, ignore zoom value from slider
+        target_size = int(canvas_side * 0.8)
+        ratio = min(target_size / width, target_size / height) if width > 0 and height > 0 else 0
+        return (int(width * ratio), int(height * ratio))
+
+    # Apply zoom first, then fit to canvas if needed
+    zoomed_size = (int(width * float(zoom)), int(height * float(zoom)))
+
+    # Now, ensure the zoomed image still fits within the canvas, downscaling if necessary
+    if zoomed_size[0] > canvas_side or zoomed_size[1] > canvas_side:
+        ratio = min(canvas_side / zoomed_size[0], canvas_side / zoomed_size[1])
+        return (int(zoomed_size[0] * ratio), int(zoomed_size[1] * ratio))
+    return zoomed_size
+
+
+class SourceTooLarge(ValueError):
+    pass
+
+
+def open_source(fp):
+    """Open a source logo, refusing anything over MAX_SOURCE_PIXELS before it is decoded."""
+    img = Image.open(fp)
+    if img.width * img.height > MAX_SOURCE_PIXELS:
+        raise SourceTooLarge(f"image is {img.width}x{img.height}, limit is {MAX_SOURCE_PIXELS} pixels")
+    return img
+
+
+def _reduce_source(img, apply_default_size, zoom):
+    """Shrink very large sources to near the output size before any effects run.
+
+    JPEGs are decoded at a reduced scale with `draft`; everything else is
+    reduced with a cheap box filter, leaving at least REDUCING_GAP times the
+    output size for the final LANCZOS resize. Returns the image and the zoom
+    to use with it, since zoom is relative to the source size.
+    """
+    orig_width = img.width
+    opaque = img.mode in ('RGB', 'L', 'CMYK', 'YCbCr') and 'transparency' not in img.info
+    if opaque:
+        # Opaque sources are never cropped, so the output size is known before decoding
+        w, h = _output_size(img.width, img.height, apply_default_size, zoom)
+        if img.format == 'JPEG' and w > 0 and h > 0:
+            try:
+                img.draft(img.mode, (w * REDUCING_GAP, h * REDUCING_GAP))
+            except Exception:
+                pass
+    else:
+        img = img.convert("RGBA")
+        bbox = img.getbbox()
+        if bbox: img = img.crop(bbox)
+        orig_width = img.width
+
+    w, h = _output_size(img.width, img.height, apply_default_size, float(zoom) * orig_width / img.width)
+    if w > 0 and h > 0:
+        factor = int(min(img.width / w, img.height / h) // REDUCING_GAP)
+        if factor >= 2:
+            img = img.reduce(factor)
+    return img, float(zoom) * orig_width / img.width
+
+
+def apply_transforms(img, apply_default_size=True, invert=False, make_white=False, contrast=1.0, zoom=1.0, monochrome=False, tint=None, engine=None):
+    with metrics.span('decode'):
+        img, zoom = _reduce_source(img, apply_default_size, zoom)
+        img.load()
+    engine = engine or TRANSFORM_ENGINE
+    with metrics.span('transform'):
+        if engine == 'fused':
+            return _apply_transforms_fused(img, apply_default_size, invert, make_white, contrast, zoom, monochrome, tint)
+        return _apply_transforms_pillow(img, apply_default_size, invert, make_white, contrast, zoom, monochrome, tint)
+
+
+def _apply_transforms_pillow(img, apply_default_size, invert, make_white, contrast, zoom, monochrome, tint):
     img = img.convert("RGBA")
     bbox = img.getbbox()
     if bbox: img = img.crop(bbox)
@@ -18,73 +146,203 @@ def apply_transforms(img, apply_default_size=True, invert=False, make_white=Fals
         img = Image.merge('RGBA', (*ImageOps.invert(Image.merge('RGB', (r, g, b))).split(), a))
     if float(contrast) != 1.0:
         img = ImageEnhance.Contrast(img).enhance(float(contrast))
-    
-    canvas_side = 1000  
-
-    if apply_default_size:
-        # Fit into 80% of canvas, ignore zoom value from slider
-        target_size = int(canvas_side * 0.8)
-        ratio = min(target_size / img.width, target_size / img.height) if img.width > 0 and img.height > 0 else 0
-        new_size = (int(img.width * ratio), int(img.height * ratio))
-    else:
-        # Apply zoom first, then fit to canvas if needed
-        zoomed_size = (int(img.width * float(zoom)), int(img.height * float(zoom)))
-        
-        # Now, ensure the zoomed image still fits within the canvas, downscaling if necessary
-        if zoomed_size[0] > canvas_side or zoomed_size[1] > canvas_side:
-            ratio = min(canvas_side / zoomed_size[0], canvas_side / zoomed_size[1])
-            new_size = (int(zoomed_size[0] * ratio), int(zoomed_size[1] * ratio))
-        else:
-            new_size = zoomed_size
 
+    new_size = _output_size(img.width, img.height, apply_default_size, zoom)
     if new_size[0] > 0 and new_size[1] > 0:
         img = img.resize(new_size, Image.Resampling.LANCZOS)
     
-    final = Image.new('RGB', (canvas_side, canvas_side), (0, 0, 0))
-    final.paste(img, ((canvas_side - img.width) // 2, (canvas_side - img.height) // 2), img)
+    final = Image.new('RGB', (CANVAS_SIDE, CANVAS_SIDE), (0, 0, 0))
+    final.paste(img, ((CANVAS_SIDE - img.width) // 2, (CANVAS_SIDE - img.height) // 2), img)
 
     # Apply server-side tinting if requested. `tint` expected as a hex string like '#RRGGBB'.
-    if tint:
-        try:
-            h = str(tint).lstrip('#')
-            if len(h) == 3:
-                h = ''.join([c*2 for c in h])
-            if len(h) == 6:
-                r, g, b = int(h[0:2], 16), int(h[2:4], 16), int(h[4:6], 16)
-                tint_img = Image.new('RGB', final.size, (r, g, b))
-                # Multiply and blend to approximate the frontend multiply overlay
-                multiplied = ImageChops.multiply(final, tint_img)
-                final = Image.blend(final, multiplied, alpha=0.6)
-        except Exception:
-            # If parsing fails, silently ignore tint
-            pass
+    rgb = _parse_tint(tint)
+    if rgb:
+        tint_img = Image.new('RGB', final.size, rgb)
+        # Multiply and blend to approximate the frontend multiply overlay
+        multiplied = ImageChops.multiply(final, tint_img)
+        final = Image.blend(final, multiplied, alpha=0.6)
 
     return final
 
-def generate_text_logo(text, font_path, rows=1, color="white", case="none"):
+
+def _f32(x):
+    return struct.unpack('f', struct.pack('f', x))[0]
+
+
+def _blend_lut(in1, in2, alpha):
+    """Image.blend for single values: float32 interpolation, clipped and truncated."""
+    alpha = _f32(alpha)
+    out = []
+    for a, b in zip(in1, in2):
+        v = _f32(a + _f32(alpha * (b - a)))
+        out.append(0 if v <= 0 else 255 if v >= 255 else int(v))
+    return out
+
+
+def _apply_transforms_fused(img, apply_default_size, invert, make_white, contrast, zoom, monochrome, tint):
+    """Same result as the Pillow engine with fewer full-image passes.
+
+    Invert and contrast only depend on each channel value, so they run as one
+    `point` pass with a lookup table instead of split/invert/merge plus a
+    blend against a degenerate image. The tint is likewise one table per
+    channel, applied to the pasted area only since it leaves black untouched.
+    The tables reproduce Pillow's integer/float32 rounding.
+    """
+    img = img.convert("RGBA")
+    bbox = img.getbbox()
+    if bbox: img = img.crop(bbox)
+    if make_white:
+        alpha = img.getchannel('A')
+        img = Image.new("RGBA", img.size, (255, 255, 255, 255))
+        img.putalpha(alpha)
+    if monochrome: img = img.convert("L").convert("RGBA")
+
+    identity = list(range(256))
+    lut = [255 - v for v in identity] if invert else identity
+    contrast = float(contrast)
+    if contrast != 1.0:
+        if invert:
+            # The mean is taken after inverting, so that pass can't be folded in
+            img = img.point(lut * 3 + identity)
+            lut = identity
+        hist = img.convert("L").histogram()
+        mean = int(sum(i * n for i, n in enumerate(hist)) / max(1, sum(hist)) + 0.5)
+        lut = _blend_lut([mean] * 256, lut, contrast)
+    if lut is not identity:
+        img = img.point(lut * 3 + identity)
+
+    new_size = _output_size(img.width, img.height, apply_default_size, zoom)
+    if new_size[0] > 0 and new_size[1] > 0:
+        img = img.resize(new_size, Image.Resampling.LANCZOS)
+
+    pos = ((CANVAS_SIDE - img.width) // 2, (CANVAS_SIDE - img.height) // 2)
+    final = Image.new('RGB', (CANVAS_SIDE, CANVAS_SIDE), (0, 0, 0))
+    final.paste(img, pos, img)
+
+    rgb = _parse_tint(tint)
+    if rgb:
+        # Multiply, then blend 60% towards it
+        tint_lut = []
+        for c in rgb:
+            tint_lut += _blend_lut(identity, [v * c // 255 for v in identity], 0.6)
+        box = (max(pos[0], 0), max(pos[1], 0), min(pos[0] + img.width, CANVAS_SIDE), min(pos[1] + img.height, CANVAS_SIDE))
+        if box[2] > box[0] and box[3] > box[1]:
+            final.paste(final.crop(box).point(tint_lut), box[:2])
+
+    return final
+
+
+_font_lock = threading.Lock()
+
+
+@lru_cache(maxsize=FONT_CACHE_SIZE)
+def _load_font(font_path, size):
+    try: return ImageFont.truetype(font_path, size)
+    except Exception: pass
+    try: return ImageFont.load_default(size)
+    except TypeError: return ImageFont.load_default()
+
+
+def get_font(font_path, size):
+    """Return a loaded font, parsing each (path, size) only once per process."""
+    if not isinstance(font_path, (str, bytes, os.PathLike)):
+        return _load_font(None, size)
+    with _font_lock:
+        return _load_font(font_path, size)
+
+
+@lru_cache(maxsize=4096)
+def _line_bbox(font_path, size, line):
+    with _font_lock:
+        font = _load_font(font_path, size)
+        return font.getbbox(line)
+
+
+def _text_lines(text, rows, case):
     if case == "upper": text = text.upper()
     elif case == "lower": text = text.lower()
     words = text.split()
     n = len(words)
     wpl = (n + int(rows) - 1) // int(rows)
-    lines = [" ".join(words[i : i + wpl]) for i in range(0, n, wpl)]
-    
-    try: font = ImageFont.truetype(font_path, 400)
-    except: font = ImageFont.load_default()
-    
-    line_imgs = []
-    d = ImageDraw.Draw(Image.new('RGBA', (1,1)))
-    for line in lines:
-        b = d.textbbox((0, 0), line, font=font)
-        li = Image.new('RGBA', (int(b[2]-b[0]), int(b[3]-b[1])), (0,0,0,0))
-        ImageDraw.Draw(li).text((-b[0], -b[1]), line, font=font, fill=color)
-        line_imgs.append(li)
-
-    max_w = max(l.width for l in line_imgs)
-    total_h = sum(l.height for l in line_imgs) + (50 * (len(lines)-1))
-    combined = Image.new('RGBA', (max_w, total_h), (0,0,0,0))
-    curr_y = 0
-    for l in line_imgs:
-        combined.paste(l, ((max_w - l.width)//2, curr_y), l)
-        curr_y += l.height + 50
-    return apply_transforms(combined)
\ No newline at end of file
+    return [" ".join(words[i : i + wpl]) for i in range(0, n, wpl)]
+
+
+def _text_block_size(font_path, size, lines):
+    boxes = [_line_bbox(font_path, size, line) for line in lines]
+    width = max(b[2] - b[0] for b in boxes)
+    height = sum(b[3] - b[1] for b in boxes) + int(size * LINE_GAP) * (len(lines) - 1)
+    return width, height
+
+
+def text_render_size(font_path, lines):
+    """Font size at which the text block fills the output area."""
+    width, height = _text_block_size(font_path, TEXT_MEASURE_SIZE, lines)
+    if width <= 0 or height <= 0:
+        return TEXT_MEASURE_SIZE
+    scale = min(TEXT_TARGET / width, TEXT_TARGET / height)
+    # Round up so the final resize only ever shrinks slightly
+    return max(8, int(TEXT_MEASURE_SIZE * scale) + 1)
+
+
+def generate_text_logo(text, font_path, rows=1, color="white", case="none"):
+    lines = _text_lines(text, rows or 1, case)
+    if not isinstance(font_path, (str, bytes, os.PathLike)):
+        font_path = None
+    with metrics.span('text_render'):
+        size = text_render_size(font_path, lines)
+        font = get_font(font_path, size)
+        gap = int(size * LINE_GAP)
+
+        line_imgs = []
+        for line in lines:
+            b = _line_bbox(font_path, size, line)
+            li = Image.new('RGBA', (int(b[2]-b[0]), int(b[3]-b[1])), (0,0,0,0))
+            with _font_lock:
+                ImageDraw.Draw(li).text((-b[0], -b[1]), line, font=font, fill=color)
+            line_imgs.append(li)
+
+        max_w = max(l.width for l in line_imgs)
+        total_h = sum(l.height for l in line_imgs) + (gap * (len(lines)-1))
+        combined = Image.new('RGBA', (max_w, total_h), (0,0,0,0))
+        curr_y = 0
+        for l in line_imgs:
+            combined.paste(l, ((max_w - l.width)//2, curr_y), l)
+            curr_y += l.height + gap
+    return apply_transforms(combined)
+
+def encode(img, fmt=None, quality=None):
+    """Encode a rendered logo in the configured output format."""
+    pil_format, _, options = OUTPUT_FORMATS[fmt or OUTPUT_FORMAT]
+    out = BytesIO()
+    with metrics.span('encode'):
+        img.save(out, pil_format, quality=quality or OUTPUT_QUALITY, **options)
+    return out.getvalue()
+
+
+def renditions(final, sizes=None, fmt=None, quality=None):
+    """Encode a full-size canvas at each rendition size; returns {size: bytes}."""
+    out = {}
+    for size in sizes or RENDITIONS:
+        img = final if size == final.width else final.resize((size, size), Image.Resampling.LANCZOS)
+        out[size] = encode(img, fmt, quality)
+    return out
+
+
+def output_filename(size=CANVAS_SIDE, fmt=None):
+    ext = OUTPUT_FORMATS[fmt or OUTPUT_FORMAT][1]
+    return f"artist{ext}" if size == CANVAS_SIDE else f"artist-{size}{ext}"
+
+
+def text_thumbnail_bytes(text, font_path, size, quality, **spec):
+    """Render a text logo as a JPEG thumbnail; takes and returns plain values for use in a worker process."""
+    return renditions(generate_text_logo(text, font_path, **spec), [size], 'jpeg', quality)
+
+
+def process_logo_bytes(data, sizes=None, fmt=None, quality=None, **transform_kwargs):
+    """Decode raw image bytes, apply transforms and encode every rendition.
+
+    Takes and returns plain bytes ({size: bytes}) so it can run inside a
+    worker process.
+    """
+    final = apply_transforms(open_source(BytesIO(data)), **transform_kwargs)
+    return renditions(final, sizes, fmt, quality)
@@ -0,0 +1,173 @@
+import os, math
+from urllib.parse import urlsplit
+from PIL import Image, ImageFile
+from kvcache import DiskCache
+import plex_utils, image_cache, metrics
+
+# fanart.tv often lists the same logo more than once: an HD upload next to an
+# older low-resolution copy, or re-uploads with a different crop. Before a
+# bulk run applies a logo, each candidate gets a perceptual hash and a few
+# quality features, cached per URL. Candidates whose hashes differ in at most
+# LOGO_DEDUP_DISTANCE bits count as one logo, represented by its best copy.
+# Features are read from fanart.tv's small preview images plus the first bytes
+# of the full image, so only the chosen logo is downloaded in full.
+DEDUP_DISTANCE = int(os.environ.get('LOGO_DEDUP_DISTANCE', 8))
+# Logos narrower than this (in source pixels) are only used if nothing else is
+MIN_WIDTH = int(os.environ.get('LOGO_MIN_WIDTH', 300))
+FEATURES_MAX_ENTRIES = int(os.environ.get('LOGO_FEATURES_MAX_ENTRIES', 50000))
+PROBE_BYTES = 64 * 1024
+ANALYSIS_SIZE = (256, 256)
+# Less visible ink than this and the image is treated as blank
+MIN_COVERAGE = 0.01
+
+features_cache = DiskCache('logo_features', max_entries=FEATURES_MAX_ENTRIES)
+
+# DCT-II basis for the 8 lowest frequencies of a 32-sample signal
+_DCT = [[math.cos(math.pi * (2 * x + 1) * u / 64) for x in range(32)] for u in range(8)]
+
+
+def phash(img):
+    """64-bit DCT perceptual hash of an RGBA image, as 16 hex digits.
+
+    Transparent areas count as mid grey, so a logo matches its copies at
+    other sizes but not its inverted or recoloured versions.
+    """
+    flat = Image.new('RGBA', img.size, (128, 128, 128, 255))
+    flat.alpha_composite(img)
+    px = list(flat.convert('L').resize((32, 32), Image.LANCZOS).getdata())
+    rows = [[sum(b * v for b, v in zip(basis, px[y * 32:(y + 1) * 32])) for basis in _DCT] for y in range(32)]
+    coeffs = [sum(_DCT[u][y] * rows[y][v] for y in range(32)) for u in range(8) for v in range(8)]
+    # The DC term only says how bright the image is; leave it out of the median
+    median = sorted(coeffs[1:])[31]
+    return '%016x' % sum(1 << i for i, c in enumerate(coeffs) if c > median)
+
+
+def distance(a, b):
+    """Number of differing bits between two hashes from phash()."""
+    return bin(int(a, 16) ^ int(b, 16)).count('1')
+
+
+def describe(img, size=None):
+    """Hash and quality features of a decoded logo.
+
+    `size` is the full image's size when `img` is a preview. 'coverage' is
+    the share of non-transparent pixels, 'bbox_fill' the share of the image
+    taken by their bounding box and 'logo_pixels' that box's area at full
+    size, i.e. the resolution left once the pipeline crops to the logo.
+    """
+    width, height = size or img.size
+    rgba = img.convert('RGBA')
+    alpha = rgba.getchannel('A')
+    bbox = alpha.getbbox()
+    fill_w = (bbox[2] - bbox[0]) / rgba.width if bbox else 0.0
+    fill_h = (bbox[3] - bbox[1]) / rgba.height if bbox else 0.0
+    return {
+        'width': width,
+        'height': height,
+        'transparent': alpha.getextrema()[0] < 255,
+        'coverage': round(1 - alpha.histogram()[0] / (rgba.width * rgba.height), 4),
+        'bbox_fill': round(fill_w * fill_h, 4),
+        'logo_pixels': int(width * fill_w * height * fill_h),
+        'phash': phash(rgba),
+    }
+
+
+def _preview_url(url):
+    """fanart.tv's small preview of an asset URL, or None for other hosts."""
+    parts = urlsplit(url)
+    if parts.netloc.endswith('fanart.tv') and parts.path.startswith('/fanart/'):
+        return url.replace('/fanart/', '/preview/', 1)
+    return None
+
+
+def _probe_size(url):
+    """Dimensions of the image at `url` read from its first bytes (a range request), or None."""
+    with metrics.external('image'):
+        r = plex_utils.session.get(url, headers={'Range': f'bytes=0-{PROBE_BYTES - 1}'}, timeout=15, stream=True)
+    try:
+        r.raise_for_status()
+        parser = ImageFile.Parser()
+        read = 0
+        # Servers that ignore the range send everything; stop reading regardless
+        for chunk in r.iter_content(8192):
+            parser.feed(chunk)
+            if parser.image:
+                return parser.image.size
+            read += len(chunk)
+            if read >= PROBE_BYTES:
+                break
+    finally:
+        r.close()
+    return None
+
+
+def analyze(url):
+    """Return the features of the logo at `url` (see describe), from cache when known.
+
+    Raises if the image can't be downloaded or decoded.
+    """
+    cached = features_cache.get(url)
+    metrics.cache('logo_features', cached is not None)
+    if cached:
+        return cached[0]
+    with metrics.span('logo_analysis'):
+        full = image_cache.lookup(url)
+        features = None
+        preview = None if full else _preview_url(url)
+        if preview:
+            try:
+                size = _probe_size(url)
+                if size:
+                    with Image.open(image_cache.fetch(preview).path) as img:
+                        features = describe(img, size)
+            except Exception as e:
+                print(f"Logo preview unavailable for {url}, analysing the full image: {e}")
+        if features is None:
+            full = full or image_cache.fetch(url)
+            with Image.open(full.path) as img:
+                size = img.size
+                img = img.convert('RGBA')
+                img.thumbnail(ANALYSIS_SIZE)
+                features = describe(img, size)
+    features_cache.set(url, features)
+    return features
+
+
+def _quality(candidate):
+    rank, _, f = candidate
+    # Transparent before opaque, then the most logo pixels, then popularity
+    return (f['transparent'], f['logo_pixels'], -rank)
+
+
+def _usable(f):
+    return f['coverage'] >= MIN_COVERAGE and f['width'] >= MIN_WIDTH
+
+
+def choose(urls):
+    """Pick the logo to apply from fanart.tv's candidate URLs (most popular first).
+
+    Near-duplicates are grouped and each group is represented by its best
+    copy; the most popular group whose best copy is usable wins. A single
+    candidate is returned without looking at it. None if `urls` is empty.
+    """
+    if len(urls) <= 1:
+        return urls[0] if urls else None
+    groups = []     # [(rank, url, features), ...] per distinct logo, most popular first
+    for rank, url in enumerate(urls):
+        try:
+            f = analyze(url)
+        except Exception as e:
+            metrics.error('logo_analysis', f"Could not analyse logo {url}: {e}", url=url)
+            continue
+        group = next((g for g in groups if distance(g[0][2]['phash'], f['phash']) <= DEDUP_DISTANCE), None)
+        if group is None:
+            groups.append([(rank, url, f)])
+        else:
+            group.append((rank, url, f))
+    if not groups:
+        return urls[0]
+    analysed = sum(len(g) for g in groups)
+    metrics.inc('logo_candidates_total', len(groups), kind='distinct')
+    metrics.inc('logo_candidates_total', analysed - len(groups), kind='duplicate')
+    best = [max(g, key=_quality) for g in groups]
+    return next((b for b in best if _usable(b[2])), best[0])[1]
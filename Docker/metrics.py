@@ -0,0 +1,306 @@
+import os, re, json, time, logging, threading, cProfile
+from contextlib import contextmanager
+from logging.handlers import RotatingFileHandler
+
+# In-process counters and latency histograms, served on /metrics in the
+# Prometheus text format, plus structured (JSON lines) logs in LOG_DIR.
+# Transforms run in worker processes; their measurements are captured there
+# and merged back by the caller (see collecting/merge).
+LOG_DIR = os.environ.get('LOG_DIR', '/app/Logs')
+LOG_MAX_BYTES = int(os.environ.get('LOG_MAX_BYTES', 10 * 1024 ** 2))
+LOG_BACKUPS = int(os.environ.get('LOG_BACKUPS', 5))
+# Requests slower than this are logged
+SLOW_REQUEST_SECONDS = float(os.environ.get('SLOW_REQUEST_SECONDS', 2.0))
+# When set (seconds), every request is profiled and the cProfile output of
+# those slower than this is written to LOG_DIR/profiles. Off by default.
+PROFILE_SLOW_REQUESTS = float(os.environ.get('PROFILE_SLOW_REQUESTS', 0))
+# With several gunicorn workers (WEB_WORKERS), each one writes its counters
+# and histograms to METRICS_DIR every few seconds and /metrics adds up all of
+# them, including workers that have since exited. Gauges stay per process.
+METRICS_DIR = os.environ.get('METRICS_DIR', os.path.join(LOG_DIR, 'metrics'))
+SHARE_INTERVAL = 5
+PREFIX = 'logos_'
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+HELP = {
+    'stage_seconds': 'Time spent in each processing stage',
+    'external_request_seconds': 'Latency of requests to Plex, fanart.tv and image hosts',
+    'http_request_seconds': 'Time to handle a request, by endpoint',
+    'cache_requests_total': 'Cache lookups by cache and result',
+    'errors_total': 'Errors by where they happened',
+    'uploads_total': 'Plex upload outcomes',
+    'logo_candidates_total': 'fanart.tv logos compared by bulk selection, distinct or duplicate',
+}
+
+# Query strings can carry credentials (Plex's X-Plex-Token, fanart.tv's
+# api_key), so they are cut from URLs in every log line and printed error
+_URL_QUERY = re.compile(r'''(https?://[^\s?#'"]*)\?[^\s#'")]*''')
+_SECRET = re.compile(r'''((?:X-Plex-Token|api_key|token)=)[^&\s'"]+''', re.IGNORECASE)
+
+_counters = {}      # (name, labels) -> value
+_histograms = {}    # (name, labels) -> [count per bucket..., sum, count]
+_gauges = {}        # name -> (help, fn)
+_lock = threading.Lock()
+_local = threading.local()
+_logger = None
+_logger_lock = threading.Lock()
+_shared = False
+
+
+def _labels(labels):
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _record(kind, name, value, labels):
+    recording = getattr(_local, 'recording', None)
+    if recording is not None:
+        recording.append((kind, name, value, labels))
+    with _lock:
+        if kind == 'counter':
+            _counters[(name, labels)] = _counters.get((name, labels), 0) + value
+        else:
+            h = _histograms.get((name, labels))
+            if h is None:
+                h = _histograms[(name, labels)] = [0] * (len(BUCKETS) + 2)
+            for i, bound in enumerate(BUCKETS):
+                if value <= bound:
+                    h[i] += 1
+            h[-2] += value
+            h[-1] += 1
+
+
+def inc(name, value=1, **labels):
+    _record('counter', name, value, _labels(labels))
+
+
+def observe(name, seconds, **labels):
+    _record('histogram', name, seconds, _labels(labels))
+
+
+def gauge(name, help, fn):
+    """Register a value read when /metrics is scraped, e.g. a queue depth."""
+    _gauges[name] = (help, fn)
+
+
+@contextmanager
+def span(stage, **labels):
+    """Time a processing stage (decode, transform, encode, plex_fetch, ...)."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe('stage_seconds', time.perf_counter() - start, stage=stage, **labels)
+
+
+@contextmanager
+def external(service):
+    """Time a request to another service, labelled with whether it raised."""
+    start = time.perf_counter()
+    outcome = 'error'
+    try:
+        yield
+        outcome = 'ok'
+    finally:
+        observe('external_request_seconds', time.perf_counter() - start, service=service, outcome=outcome)
+
+
+def cache(name, result):
+    """Count a cache lookup; `result` is True/False for hit/miss, or a string like 'revalidated'."""
+    inc('cache_requests_total', cache=name, result={True: 'hit', False: 'miss'}.get(result, result))
+
+
+def collecting(fn, *args, **kwargs):
+    """Call fn and return (result, measurements) with everything it recorded, for use in worker processes."""
+    _local.recording = []
+    try:
+        result = fn(*args, **kwargs)
+    finally:
+        recorded, _local.recording = _local.recording, None
+    return result, recorded
+
+
+def merge(recorded):
+    """Add measurements returned by collecting() in another process."""
+    for kind, name, value, labels in recorded:
+        _record(kind, name, value, labels)
+
+
+def share():
+    """Publish this process's measurements to METRICS_DIR, for /metrics in any worker."""
+    global _shared
+    if not _shared:
+        _shared = True
+        threading.Thread(target=_share_loop, daemon=True, name='metrics-share').start()
+
+
+def _share_loop():
+    while True:
+        with _lock:
+            snapshot = {'counters': [[n, l, v] for (n, l), v in _counters.items()],
+                        'histograms': [[n, l, h] for (n, l), h in _histograms.items()]}
+        path = os.path.join(METRICS_DIR, f'{os.getpid()}.json')
+        try:
+            os.makedirs(METRICS_DIR, exist_ok=True)
+            with open(path + '.tmp', 'w') as f:
+                json.dump(snapshot, f)
+            os.replace(path + '.tmp', path)
+        except OSError as e:
+            print(f"Could not write metrics to {METRICS_DIR}: {e}")
+        time.sleep(SHARE_INTERVAL)
+
+
+def _collect():
+    """Counters and histograms of this process, plus those of other workers when shared."""
+    with _lock:
+        counters = dict(_counters)
+        histograms = {k: list(h) for k, h in _histograms.items()}
+    if not _shared:
+        return counters, histograms
+    own = f'{os.getpid()}.json'
+    try:
+        names = [n for n in os.listdir(METRICS_DIR) if n.endswith('.json') and n != own]
+    except OSError:
+        names = []
+    for name in names:
+        try:
+            with open(os.path.join(METRICS_DIR, name), 'r') as f:
+                snapshot = json.load(f)
+        except (OSError, ValueError):
+            continue
+        for n, l, v in snapshot['counters']:
+            k = (n, tuple(map(tuple, l)))
+            counters[k] = counters.get(k, 0) + v
+        for n, l, h in snapshot['histograms']:
+            k = (n, tuple(map(tuple, l)))
+            histograms[k] = [a + b for a, b in zip(histograms[k], h)] if k in histograms else h
+    return counters, histograms
+
+
+def clear_shared():
+    """Forget measurements shared by earlier runs; called once before workers start."""
+    try:
+        names = os.listdir(METRICS_DIR)
+    except OSError:
+        return
+    for name in names:
+        try:
+            os.remove(os.path.join(METRICS_DIR, name))
+        except OSError:
+            pass
+
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join('%s="%s"' % (k, v.replace('\\', '\\\\').replace('"', '\\"')) for k, v in pairs) + '}'
+
+
+def render():
+    """All metrics in the Prometheus text exposition format."""
+    counters, histograms = _collect()
+    counters, histograms = sorted(counters.items()), sorted(histograms.items())
+    lines = []
+    described = set()
+
+    def describe(name, kind, help=None):
+        if name not in described:
+            described.add(name)
+            lines.append(f"# HELP {PREFIX}{name} {help or HELP.get(name, name)}")
+            lines.append(f"# TYPE {PREFIX}{name} {kind}")
+
+    for (name, labels), value in counters:
+        describe(name, 'counter')
+        lines.append(f"{PREFIX}{name}{_format_labels(labels)} {value}")
+    for (name, labels), h in histograms:
+        describe(name, 'histogram')
+        for bound, count in zip(BUCKETS, h):
+            lines.append(f"{PREFIX}{name}_bucket{_format_labels(labels, [('le', repr(bound))])} {count}")
+        lines.append(f"{PREFIX}{name}_bucket{_format_labels(labels, [('le', '+Inf')])} {h[-1]}")
+        lines.append(f"{PREFIX}{name}_sum{_format_labels(labels)} {h[-2]:.6f}")
+        lines.append(f"{PREFIX}{name}_count{_format_labels(labels)} {h[-1]}")
+    for name, (help, fn) in sorted(_gauges.items()):
+        try:
+            value = fn()
+        except Exception:
+            continue
+        describe(name, 'gauge', help)
+        lines.append(f"{PREFIX}{name} {value}")
+    return '\n'.join(lines) + '\n'
+
+
+class _JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {'ts': round(record.created, 3), 'level': record.levelname.lower(), 'event': record.getMessage()}
+        entry.update(getattr(record, 'fields', {}))
+        return json.dumps(entry, default=str)
+
+
+def _get_logger():
+    global _logger
+    if _logger is None:
+        with _logger_lock:
+            if _logger is None:
+                logger = logging.getLogger('artist_logos')
+                logger.setLevel(logging.INFO)
+                logger.propagate = False
+                try:
+                    os.makedirs(LOG_DIR, exist_ok=True)
+                    handler = RotatingFileHandler(os.path.join(LOG_DIR, 'app.log'), maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUPS)
+                    handler.setFormatter(_JsonFormatter())
+                    logger.addHandler(handler)
+                except OSError as e:
+                    print(f"Structured logging disabled, can't write to {LOG_DIR}: {e}")
+                    logger.addHandler(logging.NullHandler())
+                _logger = logger
+    return _logger
+
+
+def log(event, level='info', **fields):
+    """Write one JSON line to LOG_DIR/app.log, with URL query strings and tokens redacted from string fields."""
+    fields = {k: _redact(v) if isinstance(v, str) else v for k, v in fields.items()}
+    _get_logger().log(logging.getLevelName(level.upper()), event, extra={'fields': fields})
+
+
+def _redact(text):
+    """`text` with URL query strings and token parameters removed."""
+    return _SECRET.sub(r'\1[redacted]', _URL_QUERY.sub(r'\1?[redacted]', str(text)))
+
+
+def error(where, message, **fields):
+    """Report an error: printed as before (redacted like log()), logged as JSON and counted in errors_total."""
+    message = _redact(message)
+    print(message)
+    inc('errors_total', where=where)
+    log('error', level='error', where=where, message=message, **fields)
+
+
+def start_request():
+    """Begin profiling a request if PROFILE_SLOW_REQUESTS is set; returns the profiler or None."""
+    if not PROFILE_SLOW_REQUESTS:
+        return None
+    profile = cProfile.Profile()
+    try:
+        profile.enable()
+    except ValueError:
+        # Another profiler is active in this thread
+        return None
+    return profile
+
+
+def finish_request(endpoint, method, status, seconds, profile=None):
+    """Record a finished request; slow ones are logged and, when profiled, dumped."""
+    observe('http_request_seconds', seconds, endpoint=endpoint, method=method)
+    if profile:
+        profile.disable()
+    fields = {'endpoint': endpoint, 'method': method, 'status': status, 'seconds': round(seconds, 4)}
+    if profile and seconds >= PROFILE_SLOW_REQUESTS:
+        path = os.path.join(LOG_DIR, 'profiles', f"{time.strftime('%Y%m%d-%H%M%S')}-{endpoint}-{int(seconds * 1000)}ms.prof")
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            profile.dump_stats(path)
+            fields['profile'] = path
+        except OSError as e:
+            print(f"Could not write profile {path}: {e}")
+    if seconds >= SLOW_REQUEST_SECONDS or 'profile' in fields:
+        log('slow_request', level='warning', **fields)
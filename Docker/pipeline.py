@@ -0,0 +1,271 @@
+import os, hashlib, threading, queue, multiprocessing
+from concurrent.futures import Future, ThreadPoolExecutor, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import plex_utils, logic, image_cache, status_store, render_cache, uploads, metrics, locks, logo_select
+
+# Concurrency of each stage of the bulk pipeline. Fetching (Plex, fanart.tv and
+# the logo download) is network bound and transforms are CPU bound. The last
+# stage writes the files and hands the upload to the shared Plex upload queue,
+# which has its own concurrency limit.
+FETCH_WORKERS = int(os.environ.get('BULK_FETCH_WORKERS', 8))
+TRANSFORM_WORKERS = int(os.environ.get('BULK_TRANSFORM_WORKERS', os.cpu_count() or 2))
+UPLOAD_WORKERS = int(os.environ.get('BULK_UPLOAD_WORKERS', 2))
+# Upper bound on artists between "fetch started" and "result reported", so a
+# slow stage doesn't let downloaded images pile up in memory.
+MAX_IN_FLIGHT = int(os.environ.get('BULK_MAX_IN_FLIGHT', FETCH_WORKERS + TRANSFORM_WORKERS * 2))
+
+# Transform settings used for bulk-applied logos
+BULK_PARAMS = {'apply_default_size': True}
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def pool(name):
+    """Return the shared executor for a stage, creating it on first use.
+
+    Batch previews (see previews.py) use the fetch and transform pools too.
+    """
+    with _pools_lock:
+        if name not in _pools:
+            if name == 'transform':
+                # Started from a fork server rather than forked from this
+                # threaded process, so workers don't inherit open files such
+                # as held locks (see locks.py)
+                _pools[name] = ProcessPoolExecutor(max_workers=TRANSFORM_WORKERS, mp_context=multiprocessing.get_context('forkserver'))
+            elif name == 'fetch':
+                _pools[name] = ThreadPoolExecutor(max_workers=FETCH_WORKERS, thread_name_prefix='bulk-fetch')
+            else:
+                _pools[name] = ThreadPoolExecutor(max_workers=UPLOAD_WORKERS, thread_name_prefix='bulk-upload')
+        return _pools[name]
+
+
+def _replace(name, broken):
+    """Drop the pool `broken` so the next pool(name) starts a new one (no-op if already replaced)."""
+    with _pools_lock:
+        if _pools.get(name) is not broken:
+            return
+        del _pools[name]
+    metrics.error('pool', f"The {name} pool broke and is being restarted")
+    broken.shutdown(wait=False)
+
+
+def submit_transform(fn, *args, **kwargs):
+    """Run fn(*args, **kwargs) in the transform pool; returns a Future.
+
+    A transform process that died (e.g. killed for memory on a huge logo)
+    breaks its whole pool, failing everything in it with BrokenProcessPool.
+    The pool is then replaced and the work submitted once more.
+    """
+    out = Future()
+
+    def attempt(retry):
+        executor = pool('transform')
+        try:
+            fut = executor.submit(fn, *args, **kwargs)
+        except BrokenProcessPool as e:
+            return broke(executor, e, retry)
+        fut.add_done_callback(lambda f: done(executor, f, retry))
+
+    def broke(executor, e, retry):
+        _replace('transform', executor)
+        if retry:
+            attempt(False)
+        else:
+            out.set_exception(e)
+
+    def done(executor, f, retry):
+        if f.cancelled():
+            out.cancel()
+        elif isinstance(f.exception(), BrokenProcessPool):
+            broke(executor, f.exception(), retry)
+        elif f.exception():
+            out.set_exception(f.exception())
+        else:
+            out.set_result(f.result())
+
+    attempt(True)
+    return out
+
+
+class _Done:
+    """Queue marker telling the consumer how many artists were started."""
+    def __init__(self, count):
+        self.count = count
+
+
+def publish(artist, key, outputs, status, origin, source_url=None, source_digest=None, params=None):
+    """Write an artist's renditions, record its manifest and queue the Plex upload.
+
+    Returns None when nothing changed (the artist already has `status` and
+    its files hold the same bytes), True when finished without an upload, or
+    the upload's Future. The status is only set once the upload succeeds, so
+    a failed one isn't skipped next time.
+    """
+    folder = plex_utils.get_artist_path(artist.title)
+    uploading = os.environ.get('UPDATE_PLEX', 'false').lower() == 'true'
+    output_digest = hashlib.sha256(outputs[logic.CANVAS_SIDE]).hexdigest()
+    # Files and manifest are updated together, one writer per artist across
+    # all worker processes, so they always describe the same output
+    with locks.file_lock(locks.path_lock_name(folder)):
+        changed = render_cache.write_outputs(folder, outputs)
+        unchanged = not changed and status_store.get(key) == status
+
+        previous = status_store.get_manifest(key) if unchanged else None
+        if previous and previous['output_digest'] == output_digest:
+            upload_state = previous['upload_state']
+        else:
+            upload_state = 'local' if not uploading else 'uploaded' if unchanged else 'pending'
+        status_store.set_manifest(key, origin=origin, source_url=source_url, source_digest=source_digest,
+                                  params=render_cache.normalize(**(params or {})), output_file=logic.output_filename(),
+                                  output_digest=output_digest, upload_state=upload_state)
+    if unchanged:
+        return None
+    if not uploading:
+        status_store.set_status(key, status)
+        return True
+    upload = uploads.submit(artist, outputs[logic.UPLOAD_SIZE], on_success=lambda: status_store.set_status(key, status))
+    upload.add_done_callback(lambda f: status_store.set_upload_state(key, 'failed' if f.exception() else 'uploaded', output_digest))
+    return upload
+
+
+def is_current(manifest, source_url, params):
+    """True if a bulk-made output exists for this source and parameters and has reached Plex (when uploading)."""
+    if not manifest or manifest['origin'] != 'bulk':
+        return False
+    if manifest['source_url'] != source_url or manifest['params'] != render_cache.normalize(**params):
+        return False
+    if manifest['output_file'] != logic.output_filename():
+        return False
+    uploading = os.environ.get('UPDATE_PLEX', 'false').lower() == 'true'
+    return manifest['upload_state'] == 'uploaded' or (not uploading and manifest['upload_state'] == 'local')
+
+
+def fetch_stage(key, artist=None, sync=False, dry_run=False):
+    """Look up the artist (unless prefetched), choose its fanart.tv logo and download it.
+
+    The logo is the best copy of the most popular one (see logo_select).
+    With `sync`, artists with a custom or manually chosen logo are left alone,
+    as are those whose manifest shows the chosen logo already applied.
+    With `dry_run`, stops short of the download and reports 'would_update'.
+    """
+    if sync:
+        status = status_store.get(key)
+        manifest = status_store.get_manifest(key)
+        if status == 'custom' or (status == 'done' and (not manifest or manifest['origin'] != 'bulk')):
+            return {'key': key, 'result': 'skipped', 'message': 'chosen by hand'}
+    artist = artist or plex_utils.fetch_artist(key)
+    if not artist:
+        return {'key': key, 'result': 'error', 'message': 'artist not found'}
+    logos = plex_utils.get_fanart_logos(artist)
+    if not logos:
+        return {'key': key, 'title': artist.title, 'result': 'no_logos'}
+    source_url = logo_select.choose(logos)
+    if sync and os.path.exists(os.path.join(plex_utils.get_artist_path(artist.title), logic.output_filename())) \
+            and is_current(manifest, source_url, BULK_PARAMS):
+        return {'key': key, 'result': 'skipped', 'message': 'up to date'}
+    if dry_run:
+        return {'key': key, 'title': artist.title, 'result': 'would_update', 'source_url': source_url}
+    cached = image_cache.fetch(source_url)
+    return {'key': key, 'title': artist.title, 'artist': artist, 'data': cached.read(), 'digest': cached.digest, 'source_url': source_url}
+
+
+def upload_stage(item, outputs):
+    """Write the rendered logo to the artist folder and queue it for Plex (see publish)."""
+    return publish(item['artist'], item['key'], outputs, 'done', 'bulk',
+                   source_url=item['source_url'], source_digest=item['digest'], params=BULK_PARAMS)
+
+
+def run_bulk_apply(artist_keys, should_stop=None, sync=False, dry_run=False):
+    """Apply the chosen fanart logo to each artist through the staged pipeline.
+
+    Yields one result dict per artist, in completion order. When `should_stop`
+    returns True no new artists are started; those already in flight finish.
+    With `sync`, artists that don't need an update are reported as skipped.
+    With `dry_run`, nothing is downloaded, written or uploaded.
+    """
+    results = queue.Queue()
+    in_flight = threading.BoundedSemaphore(MAX_IN_FLIGHT)
+
+    def finish(result):
+        results.put(result)
+        in_flight.release()
+
+    def fail(key, e):
+        metrics.error('bulk_apply', f"Error updating artist {key}: {e}", rating_key=key)
+        finish({'key': key, 'result': 'error', 'message': str(e)})
+
+    def on_uploaded(item, fut):
+        try:
+            uploaded = fut.result()
+            if isinstance(uploaded, Future):
+                return uploaded.add_done_callback(lambda f: on_uploaded(item, f))
+            finish({'key': item['key'], 'title': item['title'], 'result': 'updated', 'unchanged': uploaded is None})
+        except Exception as e:
+            fail(item['key'], e)
+
+    def upload(item, outputs):
+        pool('upload').submit(upload_stage, item, outputs).add_done_callback(lambda f: on_uploaded(item, f))
+
+    def on_transformed(item, digest, params, fut):
+        try:
+            outputs, recorded = fut.result()
+            metrics.merge(recorded)
+            render_cache.put_renditions(digest, params, outputs)
+            upload(item, outputs)
+        except Exception as e:
+            fail(item['key'], e)
+
+    def on_fetched(key, fut):
+        try:
+            item = fut.result()
+            if 'data' not in item:
+                return finish(item)
+            data = item.pop('data')
+            params = BULK_PARAMS
+            digest = item['digest']
+            outputs = render_cache.get_renditions(digest, params)
+            if outputs is not None:
+                return upload(item, outputs)
+            # Stage timings recorded in the worker process come back with the result
+            submit_transform(metrics.collecting, logic.process_logo_bytes, data, **render_cache.transform_kwargs(params)).add_done_callback(
+                lambda f: on_transformed(item, digest, params, f))
+        except Exception as e:
+            fail(key, e)
+
+    def feed():
+        submitted = 0
+        keys = list(artist_keys)
+        for i in range(0, len(keys), plex_utils.FETCH_BATCH_SIZE):
+            batch = keys[i:i + plex_utils.FETCH_BATCH_SIZE]
+            # One Plex request for the whole batch; fetch_stage looks up any misses itself
+            try:
+                artists = plex_utils.fetch_artists(batch)
+            except Exception as e:
+                metrics.error('plex_fetch', f"Batched artist fetch failed, fetching one by one: {e}")
+                artists = {}
+            for key in batch:
+                if should_stop and should_stop():
+                    return results.put(_Done(submitted))
+                in_flight.acquire()
+                submitted += 1
+                try:
+                    pool('fetch').submit(fetch_stage, key, artists.get(str(key)), sync, dry_run).add_done_callback(lambda f, key=key: on_fetched(key, f))
+                except Exception as e:
+                    fail(key, e)
+        results.put(_Done(submitted))
+
+    threading.Thread(target=feed, daemon=True, name='bulk-feed').start()
+    yielded, expected = 0, None
+    while expected is None or yielded < expected:
+        result = results.get()
+        if isinstance(result, _Done):
+            expected = result.count
+            continue
+        yielded += 1
+        yield result
+
+
+def run_sync(artist_keys, should_stop=None):
+    """Bulk apply limited to new artists and those whose chosen logo or settings changed."""
+    return run_bulk_apply(artist_keys, should_stop, sync=True)
@@ -1,26 +1,186 @@
 import os
 import requests
 import re
+import time
+import threading
+from requests.adapters import HTTPAdapter
 from plexapi.server import PlexServer
+from kvcache import DiskCache
+import metrics
 
 PLEX_URL = os.environ.get('PLEX_URL')
 PLEX_TOKEN = os.environ.get('PLEX_TOKEN')
 FANART_API_KEY = os.environ.get('FANART_API_KEY')
+FANART_API_URL = os.environ.get('FANART_API_URL', 'https://webservice.fanart.tv/v3').rstrip('/')
+# The Plex connection is made on first use. If Plex can't be reached, callers
+# get None straight away until PLEX_RETRY_INTERVAL has passed, instead of each
+# waiting out its own connection timeout.
+PLEX_TIMEOUT = int(os.environ.get('PLEX_TIMEOUT', 10))
+PLEX_RETRY_INTERVAL = int(os.environ.get('PLEX_RETRY_INTERVAL', 30))
 BASE_OUTPUT_DIR = '/app/ArtistLogos'
 
-try:
-    server = PlexServer(PLEX_URL, PLEX_TOKEN)
-except Exception as e:
-    print(f"Plex Connection Error: {e}")
-    server = None
+# fanart.tv lookups are cached per MBID. Artists without logos are rechecked
+# sooner, since that is where new uploads tend to appear.
+FANART_CACHE_TTL = int(os.environ.get('FANART_CACHE_TTL', 7 * 24 * 3600))
+FANART_CACHE_EMPTY_TTL = int(os.environ.get('FANART_CACHE_EMPTY_TTL', 24 * 3600))
+FANART_CACHE_MAX_ENTRIES = int(os.environ.get('FANART_CACHE_MAX_ENTRIES', 20000))
+
+# Shared HTTP session so outgoing requests reuse pooled connections
+session = requests.Session()
+session.mount('http://', HTTPAdapter(pool_connections=20, pool_maxsize=20))
+session.mount('https://', HTTPAdapter(pool_connections=20, pool_maxsize=20))
+
+fanart_cache = DiskCache('fanart', max_entries=FANART_CACHE_MAX_ENTRIES)
+
+# Artist metadata (the plexapi object and its poster list) is kept in memory
+# for a short while, since most requests look up the same artist again
+# seconds later. Our own uploads drop the entry straight away.
+ARTIST_CACHE_TTL = int(os.environ.get('ARTIST_CACHE_TTL', 60))
+ARTIST_CACHE_MAX_ENTRIES = int(os.environ.get('ARTIST_CACHE_MAX_ENTRIES', 2000))
+# Rating keys per batched metadata request
+FETCH_BATCH_SIZE = 100
+
+_artist_cache = {}
+_poster_cache = {}
+_artist_cache_lock = threading.Lock()
+
+_server = None
+_server_failed_at = 0
+_server_lock = threading.Lock()
+
+
+def get_server():
+    """Return the PlexServer connection, connecting on first use. None if Plex is unreachable."""
+    global _server, _server_failed_at
+    if _server is None and time.time() - _server_failed_at >= PLEX_RETRY_INTERVAL:
+        with _server_lock:
+            if _server is None and time.time() - _server_failed_at >= PLEX_RETRY_INTERVAL:
+                try:
+                    with metrics.external('plex'):
+                        _server = PlexServer(PLEX_URL, PLEX_TOKEN, session=session, timeout=PLEX_TIMEOUT)
+                except Exception as e:
+                    _server_failed_at = time.time()
+                    metrics.error('plex_connect', f"Plex Connection Error: {e}")
+    return _server
+
+
+def server_state():
+    """'connected', 'unavailable' (last attempt failed) or 'pending' (not tried yet)."""
+    if _server is not None:
+        return 'connected'
+    return 'unavailable' if _server_failed_at else 'pending'
 
 
 def get_library(name):
+    server = get_server()
     return server.library.section(name) if server else None
 
 
+def list_artists(section, updated_since=None):
+    """Return lightweight artist rows (key, title, updated_at) for a library section.
+
+    Reads the raw listing instead of building full plexapi objects. With
+    `updated_since` (epoch seconds) only artists changed or added after it are
+    returned.
+    """
+    server = get_server()
+    if not server or not section:
+        return []
+    path = f'/library/sections/{section.key}/all?type=8'
+    if updated_since:
+        path += f'&updatedAt>>={int(updated_since)}'
+    rows = []
+    for el in server.query(path):
+        rows.append({
+            'key': el.attrib.get('ratingKey'),
+            'title': el.attrib.get('title', ''),
+            'updated_at': int(el.attrib.get('updatedAt') or el.attrib.get('addedAt') or 0),
+        })
+    return rows
+
+
+def count_artists(section):
+    server = get_server()
+    if not server or not section:
+        return 0
+    data = server.query(f'/library/sections/{section.key}/all?type=8&X-Plex-Container-Start=0&X-Plex-Container-Size=0')
+    return int(data.attrib.get('totalSize', 0))
+
+
+def _cached(cache, key):
+    with _artist_cache_lock:
+        entry = cache.get(str(key))
+    if entry and time.time() - entry[1] < ARTIST_CACHE_TTL:
+        return entry[0]
+    return None
+
+
+def _remember(cache, key, value):
+    with _artist_cache_lock:
+        if len(cache) >= ARTIST_CACHE_MAX_ENTRIES:
+            # Drop the oldest tenth rather than one entry per insert
+            for k, _ in sorted(cache.items(), key=lambda kv: kv[1][1])[:ARTIST_CACHE_MAX_ENTRIES // 10 or 1]:
+                del cache[k]
+        cache[str(key)] = (value, time.time())
+
+
+def invalidate_artist(rating_key):
+    """Forget cached metadata for an artist, e.g. after changing its poster."""
+    with _artist_cache_lock:
+        _artist_cache.pop(str(rating_key), None)
+        _poster_cache.pop(str(rating_key), None)
+
+
 def fetch_artist(rating_key):
-    return server.fetchItem(int(rating_key)) if server else None
+    server = get_server()
+    if not server:
+        return None
+    artist = _cached(_artist_cache, rating_key)
+    metrics.cache('plex_artist', artist is not None)
+    if artist is None:
+        with metrics.span('plex_fetch'), metrics.external('plex'):
+            artist = server.fetchItem(int(rating_key))
+        _remember(_artist_cache, rating_key, artist)
+    return artist
+
+
+def fetch_artists(rating_keys):
+    """Fetch many artists with one metadata request per FETCH_BATCH_SIZE keys.
+
+    Returns {ratingKey: artist}; keys Plex doesn't know are left out. Cached
+    artists are not requested again.
+    """
+    found = {}
+    missing = []
+    for key in map(str, rating_keys):
+        artist = _cached(_artist_cache, key)
+        if artist is not None:
+            found[key] = artist
+        else:
+            missing.append(key)
+    metrics.inc('cache_requests_total', len(found), cache='plex_artist', result='hit')
+    metrics.inc('cache_requests_total', len(missing), cache='plex_artist', result='miss')
+    if not missing:
+        return found
+    server = get_server()
+    if not server:
+        return found
+    for i in range(0, len(missing), FETCH_BATCH_SIZE):
+        path = f"/library/metadata/{','.join(missing[i:i + FETCH_BATCH_SIZE])}?includeGuids=1"
+        with metrics.span('plex_fetch', batch='true'), metrics.external('plex'):
+            data = server.query(path)
+        for artist in server.findItems(data, initpath=path):
+            key = str(artist.ratingKey)
+            _remember(_artist_cache, key, artist)
+            found[key] = artist
+    return found
+
+
+def upload_poster(artist, filepath):
+    """Upload a poster for an artist and drop its cached metadata."""
+    with metrics.span('plex_upload'), metrics.external('plex'):
+        artist.uploadPoster(filepath=filepath)
+    invalidate_artist(artist.ratingKey)
 
 
 def get_artist_path(title):
@@ -35,15 +195,33 @@ def get_fanart_logos(artist_obj):
         mbid = None
     if not mbid or not FANART_API_KEY:
         return []
-    url = f"https://webservice.fanart.tv/v3/music/{mbid}?api_key={FANART_API_KEY}"
+
+    cached = fanart_cache.get(mbid)
+    if cached:
+        logos, fetched_at = cached
+        ttl = FANART_CACHE_TTL if logos else FANART_CACHE_EMPTY_TTL
+        if time.time() - fetched_at < ttl:
+            metrics.cache('fanart', True)
+            return logos
+    metrics.cache('fanart', False)
+
+    url = f"{FANART_API_URL}/music/{mbid}?api_key={FANART_API_KEY}"
     try:
-        res = requests.get(url, timeout=10)
+        with metrics.span('fanart_lookup'), metrics.external('fanart'):
+            res = session.get(url, timeout=10)
         if res.status_code == 200:
             data = res.json()
-            return [l['url'] for l in (data.get('hdmusiclogo', []) + data.get('musiclogo', []))]
-    except Exception:
-        pass
-    return []
+            logos = [l['url'] for l in (data.get('hdmusiclogo', []) + data.get('musiclogo', []))]
+            fanart_cache.set(mbid, logos)
+            return logos
+        if res.status_code == 404:
+            # fanart.tv has nothing at all for this artist
+            fanart_cache.set(mbid, [])
+            return []
+    except Exception as e:
+        metrics.error('fanart_lookup', f"fanart.tv lookup failed for {mbid}: {e}", mbid=mbid)
+    # Serve a stale entry rather than nothing if fanart.tv is unavailable
+    return cached[0] if cached else []
 
 
 def resource_to_url(val):
@@ -53,6 +231,7 @@ def resource_to_url(val):
     """
     if not val:
         return None
+    server = get_server()
 
     # If it's already a string
     if isinstance(val, str):
@@ -106,9 +285,20 @@ def resource_to_url(val):
 
 def get_artist_posters(artist_obj):
     """Return a best-effort list of poster/artwork URLs for an artist object."""
-    posters = []
     if not artist_obj:
-        return posters
+        return []
+    key = getattr(artist_obj, 'ratingKey', None)
+    cached = _cached(_poster_cache, key) if key else None
+    metrics.cache('plex_posters', cached is not None)
+    if cached is None:
+        cached = _find_artist_posters(artist_obj)
+        if key:
+            _remember(_poster_cache, key, cached)
+    return list(cached)
+
+
+def _find_artist_posters(artist_obj):
+    posters = []
 
     try:
         # Try posters() if available
@@ -146,7 +336,7 @@ def get_artist_posters(artist_obj):
                     if u:
                         posters.append(u)
     except Exception as e:
-        print(f"get_artist_posters error: {e}")
+        metrics.error('get_artist_posters', f"get_artist_posters error: {e}")
 
     # Deduplicate while preserving order
     seen = set()
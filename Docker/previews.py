@@ -0,0 +1,138 @@
+import os, json, math, time, hashlib
+from io import BytesIO
+import logic, fonts, image_cache, render_cache, pipeline, metrics
+
+# Contact sheets: many candidate logos for one artist (fanart.tv URLs with
+# transform settings, or text logos in different fonts) rendered as small
+# thumbnails in the bulk pipeline's worker pools and sent back as one sprite
+# image, instead of one full-size preview request per candidate.
+THUMB_SIZE = int(os.environ.get('PREVIEW_THUMB_SIZE', 200))
+MAX_THUMB_SIZE = 500
+MAX_CANDIDATES = int(os.environ.get('PREVIEW_MAX_CANDIDATES', 100))
+QUALITY = int(os.environ.get('PREVIEW_QUALITY', 85))
+TEXT_PARAMS = ('rows', 'color', 'case')
+TRANSFORM_PARAMS = ('apply_default_size', 'invert', 'make_white', 'contrast', 'zoom', 'monochrome', 'tint')
+
+
+def text_spec(args):
+    """The text logo settings present in `args` (request args or a candidate dict).
+
+    Raises ValueError if `rows` isn't an integer.
+    """
+    spec = {k: args[k] for k in TEXT_PARAMS if args.get(k) is not None}
+    if 'rows' in spec:
+        try:
+            spec['rows'] = int(spec['rows'])
+        except (TypeError, ValueError):
+            raise ValueError(f"rows must be an integer, not {spec['rows']!r}")
+    return spec
+
+
+def text_digest(title, font_path, spec):
+    """Digest of everything that affects a text logo render."""
+    return hashlib.sha256(json.dumps(['text', title, font_path, spec], sort_keys=True).encode()).hexdigest()
+
+
+def canvas_key(digest):
+    """Render cache key of a text logo's full-size canvas (PNG)."""
+    return render_cache.key(digest, {}, 'canvas')
+
+
+class _Cell:
+    def __init__(self, candidate):
+        self.info = {k: candidate[k] for k in ('url', 'font') if candidate.get(k)}
+        self.key = None
+        self.thumb = None
+        self.render = None      # (function, args, kwargs) for the transform pool
+
+
+def _resolve(title, candidates, size, transform, font_wait):
+    """Work out each candidate's thumbnail cache key, fetching fanart sources in parallel."""
+    cells = [_Cell(c) for c in candidates]
+    for c in candidates:
+        if c.get('font'):
+            fonts.ensure(c['font'])
+    deadline = time.time() + font_wait
+    fetches = []
+    for cell, c in zip(cells, candidates):
+        if c.get('url'):
+            params = dict(transform, **{k: c[k] for k in TRANSFORM_PARAMS if k in c})
+            fetches.append((cell, params, pipeline.pool('fetch').submit(image_cache.fetch, c['url'])))
+        elif c.get('font'):
+            f_path = fonts.ensure(c['font'], timeout=max(0.0, deadline - time.time()))
+            if f_path is None:
+                cell.info['fallback_font'] = True
+            spec = text_spec(c)
+            digest = text_digest(title, f_path, spec)
+            cell.key = render_cache.key(digest, {}, ('thumb', size, 'jpeg', QUALITY))
+            cell.render = (logic.text_thumbnail_bytes, (title, f_path, size, QUALITY), spec)
+        else:
+            cell.info['error'] = 'candidate needs a url or a font'
+    for cell, params, fut in fetches:
+        try:
+            cached = fut.result()
+            cell.key = render_cache.key(cached.digest, params, ('thumb', size, 'jpeg', QUALITY))
+            cell.render = (logic.process_logo_bytes, (cached.read(),),
+                           dict(sizes=[size], fmt='jpeg', quality=QUALITY, **render_cache.transform_kwargs(params)))
+        except Exception as e:
+            cell.info['error'] = str(e)
+    return cells
+
+
+def render_sheet(title, candidates, size=THUMB_SIZE, columns=6, transform=None, font_wait=0):
+    """Render candidates as one JPEG sprite, `columns` thumbnails of `size` px per row.
+
+    Returns (jpeg bytes, layout, key): the layout has one entry per candidate,
+    in order, with its cell position and any error; the key changes whenever
+    the image would, so it can serve as an ETag.
+    """
+    cells = _resolve(title, candidates, size, transform or {}, font_wait)
+    columns = max(1, min(columns, len(cells)))
+    layout = []
+    for i, cell in enumerate(cells):
+        layout.append(dict(cell.info, x=(i % columns) * size, y=(i // columns) * size, size=size))
+
+    sheet_key = hashlib.sha256(json.dumps(['sheet', size, columns, QUALITY, [c.key for c in cells]]).encode()).hexdigest()
+    data = render_cache.get(sheet_key)
+    if data is not None:
+        return data, layout, sheet_key
+
+    # Identical candidates (e.g. several fonts falling back to the default) render once
+    jobs, thumbs, errors = {}, {}, {}
+    for cell in cells:
+        if cell.key is None or cell.key in jobs or cell.key in errors:
+            continue
+        cell.thumb = render_cache.get(cell.key)
+        if cell.thumb is None:
+            fn, args, kwargs = cell.render
+            try:
+                jobs[cell.key] = pipeline.submit_transform(metrics.collecting, fn, *args, **kwargs)
+            except Exception as e:
+                errors[cell.key] = str(e)
+    for key, fut in jobs.items():
+        try:
+            result, recorded = fut.result()
+            metrics.merge(recorded)
+            thumbs[key] = result[size]
+            render_cache.put(key, thumbs[key])
+        except Exception as e:
+            errors[key] = str(e)
+    for cell in cells:
+        if cell.key in errors:
+            cell.info['error'] = errors[cell.key]
+        elif cell.thumb is None and cell.key in thumbs:
+            cell.thumb = thumbs[cell.key]
+
+    rows = math.ceil(len(cells) / columns)
+    sheet = logic.Image.new('RGB', (columns * size, rows * size))
+    with metrics.span('contact_sheet'):
+        for cell, pos in zip(cells, layout):
+            if cell.thumb:
+                sheet.paste(logic.Image.open(BytesIO(cell.thumb)).convert('RGB'), (pos['x'], pos['y']))
+            if 'error' in cell.info:
+                pos['error'] = cell.info['error']
+        data = logic.encode(sheet, 'jpeg', QUALITY)
+    # Sheets with failed cells aren't kept, so the next request retries them
+    if not any('error' in pos for pos in layout):
+        render_cache.put(sheet_key, data)
+    return data, layout, sheet_key
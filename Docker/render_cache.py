@@ -0,0 +1,188 @@
+import os, json, uuid, hashlib, threading
+from collections import OrderedDict
+from kvcache import CACHE_DIR
+import logic, metrics
+
+# Rendered logos (the encoded output, one entry per rendition) keyed by the
+# source image hash, the normalized transform parameters and the output
+# encoding. Recent results are kept in memory, the rest
+# on disk under a byte budget, so tweaking a slider back and forth or rerunning
+# a bulk job doesn't redo the transform.
+RENDER_DIR = os.path.join(CACHE_DIR, 'renders')
+MEMORY_ENTRIES = int(os.environ.get('RENDER_CACHE_MEMORY_ENTRIES', 64))
+MAX_BYTES = int(os.environ.get('RENDER_CACHE_MAX_BYTES', 256 * 1024 ** 2))
+# Bump when the output of apply_transforms changes for the same parameters
+VERSION = 1
+
+_memory = OrderedDict()
+_memory_lock = threading.Lock()
+_evict_lock = threading.Lock()
+_writes = 0
+
+
+def normalize(apply_default_size=True, invert=False, make_white=False, contrast=1.0, zoom=1.0, monochrome=False, tint=None):
+    """Canonical form of the transform parameters; equivalent settings compare equal."""
+    rgb = logic._parse_tint(tint)
+    return {
+        'apply_default_size': bool(apply_default_size),
+        'invert': bool(invert),
+        'make_white': bool(make_white),
+        'contrast': round(float(1.0 if contrast is None else contrast), 4),
+        # Zoom is ignored when fitting to the default size
+        'zoom': None if apply_default_size else round(float(1.0 if zoom is None else zoom), 4),
+        'monochrome': bool(monochrome),
+        'tint': '#%02x%02x%02x' % rgb if rgb else None,
+    }
+
+
+def key(source_digest, params, size=None):
+    """Cache key for one rendition of a transformed source in the current output format."""
+    payload = json.dumps([VERSION, logic.CANVAS_SIDE, size or logic.CANVAS_SIDE, logic.OUTPUT_FORMAT,
+                          logic.OUTPUT_QUALITY, source_digest, normalize(**params)], sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def get_renditions(source_digest, params):
+    """Return {size: bytes} for every configured rendition, or None unless all are cached."""
+    out = {}
+    for size in logic.RENDITIONS:
+        data = get(key(source_digest, params, size))
+        if data is None:
+            metrics.cache('render', False)
+            return None
+        out[size] = data
+    metrics.cache('render', True)
+    return out
+
+
+def put_renditions(source_digest, params, outputs):
+    for size, data in outputs.items():
+        put(key(source_digest, params, size), data)
+
+
+def _path(k):
+    return os.path.join(RENDER_DIR, k[:2], k)
+
+
+def get(k):
+    """Return the cached bytes for key `k`, or None."""
+    with _memory_lock:
+        if k in _memory:
+            _memory.move_to_end(k)
+            return _memory[k]
+    try:
+        with open(_path(k), 'rb') as f:
+            data = f.read()
+        os.utime(_path(k))
+    except OSError:
+        return None
+    _remember(k, data)
+    return data
+
+
+def put(k, data):
+    global _writes
+    _remember(k, data)
+    path = _path(k)
+    tmp = os.path.join(RENDER_DIR, f'.tmp-{uuid.uuid4().hex}')
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(tmp, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except OSError as e:
+        print(f"Render cache write error: {e}")
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        return
+    _writes += 1
+    # Eviction scans the directory, so only do it every so often
+    if _writes % 50 == 0:
+        threading.Thread(target=_evict, daemon=True, name='render-cache-evict').start()
+
+
+def _remember(k, data):
+    with _memory_lock:
+        _memory[k] = data
+        _memory.move_to_end(k)
+        while len(_memory) > MEMORY_ENTRIES:
+            _memory.popitem(last=False)
+
+
+def _evict():
+    """Drop least recently used renders until the disk tier fits in MAX_BYTES."""
+    if not _evict_lock.acquire(blocking=False):
+        return
+    try:
+        files = []
+        for root, _, names in os.walk(RENDER_DIR):
+            for name in names:
+                if not name.startswith('.tmp-'):
+                    st = os.stat(os.path.join(root, name))
+                    files.append((st.st_mtime, st.st_size, os.path.join(root, name)))
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= MAX_BYTES:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+    except OSError as e:
+        print(f"Render cache eviction error: {e}")
+    finally:
+        _evict_lock.release()
+
+
+def render(source, source_digest=None, **params):
+    """Return {size: bytes} for `source` (raw image bytes) with `params` applied, from cache when possible."""
+    if source_digest is None:
+        source_digest = hashlib.sha256(source).hexdigest()
+    outputs = get_renditions(source_digest, params)
+    if outputs is None:
+        outputs = logic.process_logo_bytes(source, **transform_kwargs(params))
+        put_renditions(source_digest, params, outputs)
+    return outputs
+
+
+def transform_kwargs(params):
+    """apply_transforms arguments for `params`, normalized so a cached render matches its key."""
+    kwargs = normalize(**params)
+    if kwargs['zoom'] is None:
+        kwargs['zoom'] = 1.0
+    return kwargs
+
+
+def write_if_changed(path, data):
+    """Write `data` to `path` unless the file already holds exactly those bytes.
+
+    Returns True if the file was written.
+    """
+    try:
+        if os.path.getsize(path) == len(data):
+            with open(path, 'rb') as f:
+                if f.read() == data:
+                    return False
+    except OSError:
+        pass
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Written aside and renamed, so Plex and other workers never read a partial file
+    tmp = os.path.join(os.path.dirname(path), f'.tmp-{uuid.uuid4().hex}')
+    try:
+        with open(tmp, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except OSError:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    return True
+
+
+def write_outputs(folder, outputs):
+    """Write each rendition to its file in `folder`; returns True if any file changed."""
+    changed = False
+    for size, data in outputs.items():
+        changed = write_if_changed(os.path.join(folder, logic.output_filename(size)), data) or changed
+    return changed
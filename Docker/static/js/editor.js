@@ -219,107 +219,6 @@ window.closeLightbox = window.closeLightbox || function() { console.warn('closeL
 
 // --- NAVIGATION & SIDEBAR ---
 
-function updateSelectionUI() {
-    document.querySelectorAll('.artist-item').forEach(item => {
-        const key = item.id.replace('item-', '');
-        if (selectedArtists.has(key)) {
-            item.classList.add('selected');
-            item.querySelector('.artist-checkbox').checked = true;
-        } else {
-            item.classList.remove('selected');
-            item.querySelector('.artist-checkbox').checked = false;
-        }
-    });
-
-    const bulkApplyBtn = document.getElementById('bulk-apply-fanart');
-    const bulkToggleBtn = document.getElementById('bulk-toggle-status');
-    if (selectedArtists.size > 1) {
-        bulkApplyBtn.style.display = 'block';
-        bulkToggleBtn.style.display = 'block';
-    } else {
-        bulkApplyBtn.style.display = 'none';
-        bulkToggleBtn.style.display = 'none';
-    }
-    
-    document.getElementById('select-all').checked = selectedArtists.size === document.querySelectorAll('.artist-item:not([style*="display: none"])').length;
-}
-
-function handleSelection(event, key) {
-    event.stopPropagation(); // Stop it from bubbling up to the main div's loadArtist click
-    const artistItems = Array.from(document.querySelectorAll('.artist-item:not([style*="display: none"])'));
-    const clickedIndex = artistItems.findIndex(item => item.id === `item-${key}`);
-
-    if (event.shiftKey && lastSelectedArtist) {
-        const lastIndex = artistItems.findIndex(item => item.id === `item-${lastSelectedArtist}`);
-        const [start, end] = [clickedIndex, lastIndex].sort((a, b) => a - b);
-        for (let i = start; i <= end; i++) {
-            const itemKey = artistItems[i].id.replace('item-', '');
-            selectedArtists.add(itemKey);
-        }
-    } else { // This will handle normal clicks and ctrl/meta clicks
-        if (selectedArtists.has(key)) {
-            selectedArtists.delete(key);
-        } else {
-            selectedArtists.add(key);
-        }
-    }
-
-    lastSelectedArtist = `item-${key}`;
-    updateSelectionUI();
-}
-
-function selectAllArtists(checked) {
-    const visibleItems = document.querySelectorAll('.artist-item:not([style*="display: none"])');
-    if (checked) {
-        visibleItems.forEach(item => {
-            const key = item.id.replace('item-', '');
-            selectedArtists.add(key);
-        });
-    } else {
-        visibleItems.forEach(item => {
-            const key = item.id.replace('item-', '');
-            selectedArtists.delete(key);
-        });
-    }
-    updateSelectionUI();
-}
-
-function filterArtists() {
-    const q = document.getElementById("artist-search").value.toLowerCase();
-
-    document.querySelectorAll(".artist-item").forEach((i) => {
-        const status = i.getAttribute("data-status");
-        const matchesSearch = i.getAttribute("data-name").toLowerCase().includes(q);
-        
-        let matchesStatus = false;
-        if (currentStatusFilter === 'all') {
-            matchesStatus = true;
-        } else {
-            matchesStatus = (status === currentStatusFilter);
-        }
-
-        i.style.display = matchesSearch && matchesStatus ? "flex" : "none";
-    });
-}
-
-function navigateArtist(direction) {
-  const visibleItems = Array.from(
-    document.querySelectorAll(".artist-item"),
-  ).filter((i) => i.style.display !== "none");
-  const currentIndex = visibleItems.findIndex(
-    (i) => i.id === `item-${currentKey}`,
-  );
-  const nextIndex = currentIndex + direction;
-
-  if (nextIndex >= 0 && nextIndex < visibleItems.length) {
-    const nextItem = visibleItems[nextIndex];
-    loadArtist(
-      nextItem.id.replace("item-", ""),
-      nextItem.getAttribute("data-name"),
-    );
-  }
-}
-
 async function loadArtist(key, name) {
   currentKey = key;
 
@@ -328,12 +227,14 @@ async function loadArtist(key, name) {
     .querySelectorAll(".artist-item")
     .forEach((i) => i.classList.remove("active"));
   const activeItem = document.getElementById(`item-${key}`);
-  activeItem.classList.add("active");
-  activeItem.scrollIntoView({ block: "nearest", behavior: "smooth" });
+  if (activeItem) {
+    activeItem.classList.add("active");
+    activeItem.scrollIntoView({ block: "nearest", behavior: "smooth" });
+  }
 
   document.getElementById("current-artist").innerText = name;
-  document.getElementById("plex-img").src =
-    `/plex_proxy/${key}?t=${Date.now()}`;
+  // No cache-buster here: the proxy sends an ETag so unchanged images revalidate cheaply
+  document.getElementById("plex-img").src = `/plex_proxy/${key}`;
   // Ensure fanart controls are shown by default when loading an artist
   try {
     toggleExclusive('fanart-controls');
@@ -533,21 +434,69 @@ function setCase(c) {
 
 async function previewCustom() {
   if (!currentKey) return;
-  const res = await fetch("/preview_text", {
-    method: "POST",
-    headers: { "Content-Type": "application/json" },
-    body: JSON.stringify({
-      rating_key: currentKey,
-      font: selectedFont,
-      rows: document.getElementById("row-count").value,
-      color: selectedColor,
-      case: currentCase,
-    }),
+  const params = new URLSearchParams({
+    font: selectedFont,
+    rows: document.getElementById("row-count").value,
+    color: selectedColor,
+    case: currentCase,
   });
-  const data = await res.json();
-  selectedUrl = "data:image/jpeg;base64," + data.image;
+  selectedUrl = `/preview_text/${currentKey}?${params}`;
   document.getElementById("preview-img").src = selectedUrl;
   resetFilters();
+  scheduleFontThumbs();
+}
+
+// Font buttons show the artist's name in each font, cut from one contact sheet
+const FONT_THUMB_SIZE = 96;
+const FONT_THUMB_SHOWN = 48;
+let fontThumbTimer = null;
+let fontSheetUrl = null;
+
+function scheduleFontThumbs() {
+  clearTimeout(fontThumbTimer);
+  fontThumbTimer = setTimeout(loadFontThumbs, 400);
+}
+
+async function loadFontThumbs() {
+  const key = currentKey;
+  if (!key) return;
+  const params = new URLSearchParams({
+    rows: document.getElementById("row-count").value,
+    color: selectedColor,
+    case: currentCase,
+    size: FONT_THUMB_SIZE,
+    columns: 10,
+  });
+  try {
+    const res = await fetch(`/contact_sheet/${key}?${params}`);
+    if (!res.ok || key !== currentKey) return;
+    const layout = JSON.parse(res.headers.get("X-Sprite-Layout") || "[]");
+    const blob = await res.blob();
+    if (key !== currentKey) return;
+    if (fontSheetUrl) URL.revokeObjectURL(fontSheetUrl);
+    fontSheetUrl = URL.createObjectURL(blob);
+    const scale = FONT_THUMB_SHOWN / FONT_THUMB_SIZE;
+    const sheetWidth = Math.max(...layout.map((c) => c.x + c.size));
+    const cells = Object.fromEntries(layout.map((c) => [c.font, c]));
+    document.querySelectorAll("#default-fonts .font-btn").forEach((btn) => {
+      const cell = cells[btn.textContent];
+      let thumb = btn.querySelector(".font-thumb");
+      if (!cell || cell.error) {
+        if (thumb) thumb.remove();
+        return;
+      }
+      if (!thumb) {
+        thumb = document.createElement("span");
+        thumb.className = "font-thumb";
+        btn.appendChild(thumb);
+      }
+      thumb.style.backgroundImage = `url(${fontSheetUrl})`;
+      thumb.style.backgroundSize = `${sheetWidth * scale}px auto`;
+      thumb.style.backgroundPosition = `-${cell.x * scale}px -${cell.y * scale}px`;
+    });
+  } catch (e) {
+    console.warn("Font thumbnails unavailable", e);
+  }
 }
 
 async function saveCustom() {
@@ -565,7 +514,7 @@ async function saveCustom() {
 
   const data = await res.json();
   if (data.status === "success") {
-    showToast("Custom text logo saved!");
+    showToast(data.upload === "queued" ? "Custom text logo saved; Plex upload queued." : "Custom text logo saved!");
     updateStatus(currentKey, "custom");
     document.getElementById("plex-img").src =
       `/plex_proxy/${currentKey}?t=${Date.now()}`;
@@ -578,7 +527,7 @@ async function applyMostPopularFanart() {
         return showToast("No artists selected.", "error");
     }
 
-    showToast(`Applying most popular logo to ${artists.length} artists...`);
+    showToast(`Applying best fanart logo to ${artists.length} artists...`);
 
     const res = await fetch('/bulk_apply_fanart', {
         method: 'POST',
@@ -587,13 +536,14 @@ async function applyMostPopularFanart() {
     });
 
     const data = await res.json();
-    if (data.status === 'success') {
-        showToast(`Successfully updated ${data.updated_count} artists.`);
-        // Refresh status dots for updated artists
-        artists.forEach(key => updateStatus(key, 'done'));
-    } else {
-        showToast("An error occurred during bulk update.", "error");
+    if (data.status !== 'success') {
+        return showToast("An error occurred during bulk update.", "error");
     }
+
+    const job = await followJob(data.job_id, artists.length, (line) => {
+        if (line.result === 'updated') updateStatus(line.key, 'done');
+    });
+    showBulkResult(job);
 }
 
 async function bulkToggleStatus() {
@@ -611,17 +561,57 @@ async function bulkToggleStatus() {
     });
 
     const data = await res.json();
-    if (data.status === 'success') {
-        showToast(`Successfully updated ${data.updated_count} artists.`);
-        // Refresh status dots for updated artists
-        data.updated_artists.forEach(artist => {
-            updateStatus(artist.key, artist.new_status);
-        });
+    if (data.status !== 'success') {
+        return showToast("An error occurred during bulk update.", "error");
+    }
+
+    Object.entries(data.new_statuses).forEach(([key, status]) => updateStatus(key, status));
+    showToast(`Successfully updated ${data.updated_count} artists.`);
+}
+
+// Follow a background job's event stream. Bulk jobs keep running on the
+// server if the page is closed; this only reports progress.
+async function followJob(jobId, total, onResult) {
+    let job = null;
+    let processed = 0;
+    const res = await fetch(`/jobs/${jobId}/events`);
+    await readNdjson(res, (line) => {
+        if (line.key) {
+            processed++;
+            onResult(line);
+            if (processed % 25 === 0) showToast(`Processed ${processed} of ${total} artists...`);
+        } else {
+            job = line;
+        }
+    });
+    return job;
+}
+
+function showBulkResult(job) {
+    if (job && job.status === 'completed') {
+        showToast(`Successfully updated ${job.updated_count} artists.`);
+    } else if (job && job.status === 'cancelled') {
+        showToast(`Bulk job cancelled after ${job.updated_count} artists.`);
     } else {
         showToast("An error occurred during bulk update.", "error");
     }
 }
 
+async function readNdjson(res, onLine) {
+    const reader = res.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    while (true) {
+        const { done, value } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        const lines = buffer.split('\n');
+        buffer = lines.pop();
+        lines.filter(l => l.trim()).forEach(l => onLine(JSON.parse(l)));
+    }
+    if (buffer.trim()) onLine(JSON.parse(buffer));
+}
+
 // --- SAVING ---
 
 async function save() {
@@ -643,9 +633,10 @@ async function save() {
     }),
   });
 
+  if (res.status === 413) return showToast("Image is too large.", "error");
   const data = await res.json();
   if (data.status === "success") {
-    showToast("Saved to Plex!");
+    showToast(data.unchanged ? "Already up to date." : data.upload === "queued" ? "Saved; Plex upload queued." : "Saved to Plex!");
     // Refresh local UI state
     updateStatus(currentKey, "done");
     document.getElementById("plex-img").src =
@@ -668,7 +659,7 @@ async function saveCustom() {
 
   const data = await res.json();
   if (data.status === "success") {
-    showToast("Custom text logo saved!");
+    showToast(data.upload === "queued" ? "Custom text logo saved; Plex upload queued." : "Custom text logo saved!");
     updateStatus(currentKey, "custom");
     document.getElementById("plex-img").src =
       `/plex_proxy/${currentKey}?t=${Date.now()}`;
@@ -687,15 +678,6 @@ async function toggleStatus(event, key) {
 
 // --- UTILS ---
 
-function updateStatus(key, status) {
-  const item = document.getElementById(`item-${key}`);
-  if (item) {
-    item.setAttribute("data-status", status);
-    const dot = item.querySelector(".status-dot");
-    dot.className = `status-dot status-${status}`;
-  }
-}
-
 function showToast(msg) {
   const t = document.getElementById("toast");
   t.innerText = "✅ " + msg;
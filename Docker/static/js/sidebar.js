@@ -0,0 +1,176 @@
+/* Artist sidebar: paged list, search and selection (moved from editor.js) */
+
+const ARTIST_PAGE_SIZE = 100;
+let artistList = [];       // artists loaded so far for the current search/filter
+let artistCursor = null;   // cursor for the next page, null when everything is loaded
+let artistTotal = 0;       // number of artists matching the current search/filter
+let artistListLoading = false;
+let artistQueryId = 0;
+let artistSearchTimer = null;
+
+function artistQuery(extra) {
+  const params = new URLSearchParams({
+    q: document.getElementById('artist-search').value,
+    status: currentStatusFilter,
+    ...extra,
+  });
+  return `/api/artists?${params}`;
+}
+
+function renderArtistItem(a) {
+  const item = document.createElement('div');
+  item.className = 'artist-item';
+  item.id = `item-${a.key}`;
+  item.setAttribute('data-name', a.title);
+  item.setAttribute('data-status', a.status);
+  item.onclick = () => loadArtist(a.key, a.title);
+  if (a.key === currentKey) item.classList.add('active');
+
+  const checkbox = document.createElement('input');
+  checkbox.type = 'checkbox';
+  checkbox.className = 'artist-checkbox';
+  checkbox.setAttribute('data-key', a.key);
+  checkbox.onclick = (e) => handleSelection(e, a.key);
+
+  const name = document.createElement('span');
+  name.className = 'artist-name';
+  name.textContent = a.title;
+
+  const dot = document.createElement('button');
+  dot.className = `status-dot status-${a.status}`;
+  dot.onclick = (e) => toggleStatus(e, a.key);
+
+  item.append(checkbox, name, dot);
+  return item;
+}
+
+// Load the next window of artists; with reset, start over for a new search/filter
+async function loadArtistPage(reset) {
+  const list = document.getElementById('artist-list');
+  if (reset) {
+    artistQueryId++;
+    artistList = [];
+    artistCursor = null;
+    artistListLoading = false;
+    list.innerHTML = '';
+  } else if (artistCursor === null || artistListLoading) {
+    return;
+  }
+
+  const queryId = artistQueryId;
+  artistListLoading = true;
+  try {
+    const res = await fetch(artistQuery({ cursor: artistCursor || 0, limit: ARTIST_PAGE_SIZE }));
+    const data = await res.json();
+    if (queryId !== artistQueryId) return; // a newer search replaced this one
+    artistCursor = data.next_cursor;
+    artistTotal = data.total;
+    artistList.push(...data.artists);
+    data.artists.forEach(a => list.appendChild(renderArtistItem(a)));
+    updateSelectionUI();
+    if (data.loading) {
+      // Plex isn't reachable yet; try again unless a new search starts first
+      setTimeout(() => { if (queryId === artistQueryId) loadArtistPage(true); }, 3000);
+    }
+  } finally {
+    if (queryId === artistQueryId) artistListLoading = false;
+  }
+  // Keep filling until the list can scroll
+  if (queryId === artistQueryId && artistCursor !== null && list.scrollHeight <= list.clientHeight) {
+    await loadArtistPage(false);
+  }
+}
+
+function updateSelectionUI() {
+    document.querySelectorAll('.artist-item').forEach(item => {
+        const key = item.id.replace('item-', '');
+        if (selectedArtists.has(key)) {
+            item.classList.add('selected');
+            item.querySelector('.artist-checkbox').checked = true;
+        } else {
+            item.classList.remove('selected');
+            item.querySelector('.artist-checkbox').checked = false;
+        }
+    });
+
+    const bulkApplyBtn = document.getElementById('bulk-apply-fanart');
+    const bulkToggleBtn = document.getElementById('bulk-toggle-status');
+    if (selectedArtists.size > 1) {
+        bulkApplyBtn.style.display = 'block';
+        bulkToggleBtn.style.display = 'block';
+    } else {
+        bulkApplyBtn.style.display = 'none';
+        bulkToggleBtn.style.display = 'none';
+    }
+
+    document.getElementById('select-all').checked = artistTotal > 0 && selectedArtists.size === artistTotal;
+}
+
+function handleSelection(event, key) {
+    event.stopPropagation(); // Stop it from bubbling up to the main div's loadArtist click
+    const clickedIndex = artistList.findIndex(a => a.key === key);
+
+    if (event.shiftKey && lastSelectedArtist) {
+        const lastIndex = artistList.findIndex(a => a.key === lastSelectedArtist);
+        if (lastIndex !== -1) {
+            const [start, end] = [clickedIndex, lastIndex].sort((a, b) => a - b);
+            for (let i = start; i <= end; i++) selectedArtists.add(artistList[i].key);
+        }
+    } else { // This will handle normal clicks and ctrl/meta clicks
+        if (selectedArtists.has(key)) {
+            selectedArtists.delete(key);
+        } else {
+            selectedArtists.add(key);
+        }
+    }
+
+    lastSelectedArtist = key;
+    updateSelectionUI();
+}
+
+// Select every artist matching the current search/filter, not just the loaded ones
+async function selectAllArtists(checked) {
+    const res = await fetch(artistQuery({ keys_only: 1 }));
+    const data = await res.json();
+    data.keys.forEach(key => checked ? selectedArtists.add(key) : selectedArtists.delete(key));
+    updateSelectionUI();
+}
+
+function filterArtists() {
+    clearTimeout(artistSearchTimer);
+    artistSearchTimer = setTimeout(() => loadArtistPage(true), 150);
+}
+
+async function navigateArtist(direction) {
+  const currentIndex = artistList.findIndex(a => a.key === currentKey);
+  const nextIndex = currentIndex + direction;
+
+  while (nextIndex >= artistList.length && artistCursor !== null) {
+    await loadArtistPage(false);
+    if (artistListLoading) return;
+  }
+  if (nextIndex >= 0 && nextIndex < artistList.length) {
+    const next = artistList[nextIndex];
+    loadArtist(next.key, next.title);
+  }
+}
+
+function updateStatus(key, status) {
+  const entry = artistList.find(a => a.key === key);
+  if (entry) entry.status = status;
+  const item = document.getElementById(`item-${key}`);
+  if (item) {
+    item.setAttribute("data-status", status);
+    const dot = item.querySelector(".status-dot");
+    dot.className = `status-dot status-${status}`;
+  }
+}
+
+document.addEventListener('DOMContentLoaded', () => {
+  const list = document.getElementById('artist-list');
+  if (!list) return;
+  list.addEventListener('scroll', () => {
+    if (list.scrollTop + list.clientHeight >= list.scrollHeight - 400) loadArtistPage(false);
+  });
+  loadArtistPage(true);
+});
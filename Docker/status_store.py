@@ -0,0 +1,173 @@
+import os, json, time, sqlite3
+from contextlib import closing
+import plex_utils, locks
+
+# All artist statuses ('none', 'custom', 'done') live in one SQLite database
+# keyed by ratingKey. WAL mode lets the page read while a bulk job writes, and
+# bulk changes are applied in a single transaction.
+STATUS_DB = os.environ.get('STATUS_DB', os.path.join(plex_utils.BASE_OUTPUT_DIR, 'status.db'))
+# Each artist's output also has a manifest recording what produced it:
+# origin ('bulk', 'manual' or 'custom'), source URL and hash, transform
+# parameters, output file and hash, and the Plex upload state ('pending',
+# 'uploaded', 'failed', or 'local' when uploads are off). Sync compares
+# against it to find artists whose inputs changed.
+MANIFEST_FIELDS = ('origin', 'source_url', 'source_digest', 'params', 'output_file', 'output_digest', 'upload_state')
+# Store used before the database; imported once if present
+LEGACY_STATUS_FILE = os.path.join(plex_utils.BASE_OUTPUT_DIR, 'statuses.json')
+
+_ready = False
+
+
+def _connect():
+    global _ready
+    if not _ready:
+        os.makedirs(os.path.dirname(STATUS_DB), exist_ok=True)
+    conn = sqlite3.connect(STATUS_DB, timeout=30)
+    if not _ready:
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.executescript('''
+            CREATE TABLE IF NOT EXISTS statuses (
+                rating_key TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                updated_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS meta (
+                key TEXT PRIMARY KEY,
+                value TEXT
+            );
+            CREATE TABLE IF NOT EXISTS manifests (
+                rating_key TEXT PRIMARY KEY,
+                origin TEXT NOT NULL,
+                source_url TEXT,
+                source_digest TEXT,
+                params TEXT,
+                output_file TEXT,
+                output_digest TEXT,
+                upload_state TEXT,
+                updated_at REAL NOT NULL
+            );
+        ''')
+        _ready = True
+    return conn
+
+
+def load_all():
+    """Return a {ratingKey: status} dict of every artist with a status."""
+    with closing(_connect()) as conn:
+        return dict(conn.execute('SELECT rating_key, status FROM statuses').fetchall())
+
+
+def get(rating_key):
+    with closing(_connect()) as conn:
+        row = conn.execute('SELECT status FROM statuses WHERE rating_key = ?', (str(rating_key),)).fetchone()
+    return row[0] if row else 'none'
+
+
+def set_status(rating_key, status):
+    set_many({rating_key: status})
+
+
+def set_many(statuses):
+    """Write a {ratingKey: status} dict in one transaction."""
+    now = time.time()
+    with closing(_connect()) as conn, conn:
+        conn.executemany('INSERT OR REPLACE INTO statuses VALUES (?, ?, ?)',
+                         [(str(k), s, now) for k, s in statuses.items()])
+
+
+def next_status(current):
+    """Cycle none -> custom -> done -> none."""
+    return {'none': 'custom', 'custom': 'done'}.get(current, 'none')
+
+
+def toggle_many(rating_keys):
+    """Advance each artist's status in one transaction; returns {ratingKey: new_status}."""
+    keys = [str(k) for k in rating_keys]
+    now = time.time()
+    with closing(_connect()) as conn:
+        conn.isolation_level = None
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            current = {}
+            for i in range(0, len(keys), 500):
+                chunk = keys[i:i + 500]
+                current.update(conn.execute(
+                    f"SELECT rating_key, status FROM statuses WHERE rating_key IN ({','.join('?' * len(chunk))})", chunk).fetchall())
+            updated = {k: next_status(current.get(k, 'none')) for k in keys}
+            conn.executemany('INSERT OR REPLACE INTO statuses VALUES (?, ?, ?)',
+                             [(k, s, now) for k, s in updated.items()])
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+    return updated
+
+
+def _manifest(row):
+    m = dict(zip(('rating_key',) + MANIFEST_FIELDS + ('updated_at',), row))
+    m['params'] = json.loads(m['params']) if m['params'] else {}
+    return m
+
+
+def get_manifest(rating_key):
+    """Return the manifest for an artist's current output, or None."""
+    return get_manifests([rating_key]).get(str(rating_key))
+
+
+def get_manifests(rating_keys):
+    """Return {ratingKey: manifest} for the given artists that have one."""
+    keys = [str(k) for k in rating_keys]
+    out = {}
+    with closing(_connect()) as conn:
+        for i in range(0, len(keys), 500):
+            chunk = keys[i:i + 500]
+            for row in conn.execute(f"SELECT * FROM manifests WHERE rating_key IN ({','.join('?' * len(chunk))})", chunk):
+                out[row[0]] = _manifest(row)
+    return out
+
+
+def set_manifest(rating_key, **fields):
+    """Replace an artist's manifest; `params` is stored as JSON."""
+    fields['params'] = json.dumps(fields.get('params') or {}, sort_keys=True)
+    with closing(_connect()) as conn, conn:
+        conn.execute('INSERT OR REPLACE INTO manifests VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                     (str(rating_key), *(fields.get(f) for f in MANIFEST_FIELDS), time.time()))
+
+
+def set_upload_state(rating_key, state, output_digest=None):
+    """Record the Plex upload outcome, unless the manifest moved on to a different output."""
+    with closing(_connect()) as conn, conn:
+        conn.execute('UPDATE manifests SET upload_state = ?, updated_at = ? WHERE rating_key = ? AND (? IS NULL OR output_digest = ?)',
+                     (state, time.time(), str(rating_key), output_digest, output_digest))
+
+
+def import_legacy(artists):
+    """One-time import of statuses from before this database existed.
+
+    Reads `statuses.json` and the old per-artist `.status` files. `artists` is
+    an iterable of dicts with 'key' and 'title', since the old files were
+    keyed by artist folder rather than ratingKey.
+    """
+    # The lock keeps worker processes warming up together from importing twice
+    with locks.file_lock('status-import'), closing(_connect()) as conn:
+        if conn.execute("SELECT 1 FROM meta WHERE key = 'legacy_imported'").fetchone():
+            return
+        existing = dict(conn.execute('SELECT rating_key, status FROM statuses').fetchall())
+        found = {}
+        try:
+            with open(LEGACY_STATUS_FILE, 'r') as f:
+                found.update(json.load(f).get('statuses', {}))
+        except (FileNotFoundError, ValueError):
+            pass
+        for a in artists:
+            if a['key'] in found:
+                continue
+            status_file = os.path.join(plex_utils.get_artist_path(a['title']), '.status')
+            if os.path.exists(status_file):
+                with open(status_file, 'r') as f:
+                    found[a['key']] = f.read().strip() or 'none'
+        now = time.time()
+        with conn:
+            conn.executemany('INSERT OR IGNORE INTO statuses VALUES (?, ?, ?)',
+                             [(k, s, now) for k, s in found.items() if k not in existing])
+            conn.execute("INSERT INTO meta VALUES ('legacy_imported', ?)", (str(now),))
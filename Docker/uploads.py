@@ -0,0 +1,186 @@
+import os, time, random, threading
+from collections import deque
+from concurrent.futures import Future
+from kvcache import DiskCache
+import plex_utils, metrics, locks
+
+# All poster uploads to Plex go through this queue. Uploads carry the image
+# bytes, so nothing is staged in temp files; a newer upload for an artist that
+# is still waiting replaces the older one (last write wins), and at most one
+# upload per artist runs at a time so an older image can't land after a newer
+# one. Across worker processes the same holds through a per-artist file lock
+# and a shared record of when the last uploaded image was queued. A fixed
+# number of workers keeps Plex from being flooded, and failures are retried
+# with exponential backoff.
+CONCURRENCY = int(os.environ.get('PLEX_UPLOAD_CONCURRENCY', 2))
+MAX_ATTEMPTS = int(os.environ.get('PLEX_UPLOAD_ATTEMPTS', 5))
+BACKOFF = float(os.environ.get('PLEX_UPLOAD_BACKOFF', 1.0))
+MAX_BACKOFF = float(os.environ.get('PLEX_UPLOAD_MAX_BACKOFF', 60.0))
+
+
+class _Upload:
+    def __init__(self, artist, data):
+        self.artist = artist
+        self.data = data
+        self.queued_at = time.time()
+        self.futures = []
+        self.callbacks = []
+
+
+_pending = {}       # ratingKey -> _Upload waiting to run
+_order = deque()    # ratingKeys in the order they were queued
+_uploading = set()  # ratingKeys being uploaded right now
+_cond = threading.Condition()
+_workers = []
+# ratingKey -> queued_at of the newest image sent to Plex by any process
+_sent = DiskCache('plex_uploads')
+_stats = {'completed': 0, 'failed': 0, 'retries': 0, 'superseded': 0, 'in_progress': 0, 'last_error': None}
+
+
+def submit(artist, data, on_success=None):
+    """Queue `data` (image bytes) as the poster for `artist`.
+
+    Returns a Future that resolves to True once the upload succeeds, or
+    raises the last error after MAX_ATTEMPTS. If another upload for the same
+    artist is queued before this one runs, only the newest image is sent and
+    both futures resolve with its outcome. `on_success` is called after a
+    successful upload.
+    """
+    key = str(artist.ratingKey)
+    fut = Future()
+    with _cond:
+        _start()
+        upload = _pending.get(key)
+        if upload:
+            upload.artist, upload.data, upload.queued_at = artist, data, time.time()
+            _stats['superseded'] += 1
+            metrics.inc('uploads_total', outcome='superseded')
+        else:
+            upload = _pending[key] = _Upload(artist, data)
+            _order.append(key)
+        upload.futures.append(fut)
+        if on_success:
+            upload.callbacks.append(on_success)
+        _cond.notify()
+    return fut
+
+
+def stats():
+    """Queue depth and counters since startup."""
+    with _cond:
+        return {'queued': len(_pending), 'workers': CONCURRENCY, **_stats}
+
+
+metrics.gauge('upload_queue_depth', 'Plex uploads waiting to run', lambda: len(_pending))
+metrics.gauge('uploads_in_progress', 'Plex uploads running now', lambda: _stats['in_progress'])
+
+
+def _start():
+    # Called with _cond held
+    while len(_workers) < CONCURRENCY:
+        t = threading.Thread(target=_work, daemon=True, name=f'plex-upload-{len(_workers)}')
+        _workers.append(t)
+        t.start()
+
+
+def _next_key():
+    # Called with _cond held: the oldest queued artist not already uploading
+    return next((key for key in _order if key not in _uploading), None)
+
+
+def _work():
+    while True:
+        with _cond:
+            key = _next_key()
+            while key is None:
+                _cond.wait()
+                key = _next_key()
+            _order.remove(key)
+            upload = _pending.pop(key)
+            _uploading.add(key)
+            _stats['in_progress'] += 1
+        try:
+            _run(key, upload)
+        finally:
+            with _cond:
+                _uploading.discard(key)
+                _stats['in_progress'] -= 1
+                # A newer upload for this artist may be waiting for this one
+                _cond.notify_all()
+
+
+def _hand_over(key, upload):
+    # Called with _cond held: give our waiters to a newer queued image for the
+    # same artist, if there is one; returns whether there was
+    newer = _pending.get(key)
+    if newer:
+        newer.futures[:0] = upload.futures
+        newer.callbacks[:0] = upload.callbacks
+    return bool(newer)
+
+
+def _send(key, upload):
+    """Upload unless a newer image for the artist is queued here or was sent by another process.
+
+    Returns 'sent', 'handed_over' (see _hand_over) or 'superseded'.
+    """
+    with locks.file_lock(f'upload-{key}'):
+        with _cond:
+            if _hand_over(key, upload):
+                return 'handed_over'
+        sent = _sent.get(key)
+        if sent and sent[0] > upload.queued_at:
+            return 'superseded'
+        plex_utils.upload_poster(upload.artist, upload.data)
+        _sent.set(key, upload.queued_at)
+    return 'sent'
+
+
+def _run(key, upload):
+    for attempt in range(MAX_ATTEMPTS):
+        try:
+            outcome = _send(key, upload)
+        except Exception as e:
+            error = e
+            with _cond:
+                _stats['last_error'] = f"{upload.artist.title}: {e}"
+                # A newer image is already queued; it takes over our waiters
+                if _hand_over(key, upload):
+                    return
+                if attempt + 1 < MAX_ATTEMPTS:
+                    _stats['retries'] += 1
+                    metrics.inc('uploads_total', outcome='retried')
+            if attempt + 1 < MAX_ATTEMPTS:
+                delay = min(BACKOFF * 2 ** attempt, MAX_BACKOFF)
+                print(f"Upload for {upload.artist.title} failed ({e}), retrying in {delay:.1f}s")
+                time.sleep(delay * random.uniform(0.8, 1.2))
+            continue
+        if outcome == 'handed_over':
+            return
+        if outcome == 'superseded':
+            # Another process already sent a newer image for this artist
+            with _cond:
+                _stats['superseded'] += 1
+            metrics.inc('uploads_total', outcome='superseded')
+            for fut in upload.futures:
+                fut.set_result(True)
+            return
+        with _cond:
+            _stats['completed'] += 1
+        metrics.inc('uploads_total', outcome='completed')
+        for callback in upload.callbacks:
+            try:
+                callback()
+            except Exception as e:
+                metrics.error('upload_callback', f"Upload callback error for {upload.artist.title}: {e}", rating_key=key)
+        for fut in upload.futures:
+            fut.set_result(True)
+        return
+
+    metrics.error('upload', f"Upload for {upload.artist.title} failed after {MAX_ATTEMPTS} attempts: {error}",
+                  rating_key=key)
+    with _cond:
+        _stats['failed'] += 1
+    metrics.inc('uploads_total', outcome='failed')
+    for fut in upload.futures:
+        fut.set_exception(error)
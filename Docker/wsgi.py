@@ -0,0 +1,4 @@
+"""Production entry point: `gunicorn -c gunicorn.conf.py wsgi:app`."""
+from app import app, start_background
+
+start_background()